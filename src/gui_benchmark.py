@@ -0,0 +1,128 @@
+"""Render benchmark for the Simple GUI.
+
+Drives SimpleGUI.draw_display on an OffscreenFramebuffer for every gui_layout
+and framebuffer depth, so rendering performance can be measured on any Linux
+box without HDMI, camera or Redis:
+
+    python3 gui_benchmark.py [--frames 200] [--size 1920x1080] [--bpp 16 24 32]
+
+Three scenarios are run per combination:
+    idle      only CPU load changes between frames (typical while standing by)
+    changing  ISO, shutter, fps, CPU and minutes left change every frame
+    full      the recording colour toggles every frame, forcing full repaints
+
+For each it reports frames/sec, mean and p95 ms per frame, and the peak
+memory allocated while drawing one frame (tracemalloc).
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from module.framebuffer import OffscreenFramebuffer
+from module.perf_stats import RollingStats
+from module.simple_gui import SimpleGUI, GUI_LAYOUTS
+
+ISO_STEPS = ['100', '200', '400', '800', '1600', '3200']
+SHUTTER_STEPS = ['45', '90', '172.8', '180', '270', '360']
+
+
+class Event:
+    def subscribe(self, listener, **kwargs):
+        pass
+
+
+def make_gui(size, bits_per_pixel, gui_layout):
+    cinepi_controller = SimpleNamespace(gui_layout=gui_layout, pwm_mode=False, fps_double=False,
+                                        shutter_a_sync=True, parameters_lock=True,
+                                        exposure_time_fractions='1/48', fps_actual=24, file_size=3.2,
+                                        state_changed_event=Event())
+    redis_controller = SimpleNamespace(get_value=lambda key, default=None: default,
+                                       set_stat=lambda key, value: None,
+                                       redis_parameter_changed=Event())
+    gui = SimpleGUI(pwm_controller=SimpleNamespace(shutter_angle=180, fps=24),
+                    redis_controller=redis_controller,
+                    cinepi_controller=cinepi_controller,
+                    usb_monitor=SimpleNamespace(usb_mic=True, usb_keyboard=True, usb_event=Event()),
+                    ssd_monitor=SimpleNamespace(last_space_left=100.0, ssd_event=Event(), unmount_event=Event()),
+                    serial_handler=SimpleNamespace(current_ports=['/dev/ttyACM0'], ports_changed_event=Event()),
+                    dmesg_monitor=SimpleNamespace(undervoltage_flag=True, undervoltage_event=Event()),
+                    fb=OffscreenFramebuffer(size, bits_per_pixel),
+                    autostart=False)
+    set_values(gui, 0, 'idle')
+    return gui
+
+
+def set_values(gui, frame, scenario):
+    """Stand-in for SimpleGUI.get_values with deterministic values"""
+    changing = scenario == 'changing'
+    gui.iso = ISO_STEPS[frame % len(ISO_STEPS)] if changing else '800'
+    gui.shutter_a = SHUTTER_STEPS[frame % len(SHUTTER_STEPS)] if changing else '180'
+    gui.shutter_a_nom = gui.shutter_a
+    gui.fps = 24 + frame % 26 if changing else 24
+    gui.min_left = 600 - frame % 600 if changing else 600
+    gui.is_recording = frame % 2 if scenario == 'full' else 0
+    gui.cpu_load = f"{frame % 100}.0%"
+    gui.cpu_temp = f"{40 + frame % 20 if changing else 45}°"
+
+
+def run_scenario(gui, scenario, frames):
+    timings = RollingStats(window=frames)
+    peaks = []
+    # one untimed frame so the scenario starts from a fully painted screen
+    set_values(gui, 0, scenario)
+    gui.draw_display()
+
+    start = time.perf_counter()
+    for frame in range(1, frames + 1):
+        set_values(gui, frame, scenario)
+        frame_start = time.perf_counter()
+        gui.draw_display()
+        timings.add((time.perf_counter() - frame_start) * 1000)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for frame in range(frames + 1, frames + 1 + min(frames, 20)):
+        set_values(gui, frame, scenario)
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        gui.draw_display()
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    summary = timings.summary()
+    return {
+        'fps': frames / elapsed,
+        'mean_ms': elapsed * 1000 / frames,
+        'p95_ms': summary['p95'],
+        'peak_kb': max(peaks) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simple GUI render benchmark")
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--size', default='1920x1080')
+    parser.add_argument('--bpp', type=int, nargs='+', default=[16, 24, 32])
+    parser.add_argument('--layouts', type=int, nargs='+', default=sorted(GUI_LAYOUTS))
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.split('x'))
+
+    print(f"{'layout':>6} {'bpp':>4} {'scenario':>9} {'fps':>9} {'mean ms':>8} {'p95 ms':>7} {'peak KB':>8}")
+    for gui_layout in args.layouts:
+        for bits_per_pixel in args.bpp:
+            gui = make_gui(size, bits_per_pixel, gui_layout)
+            for scenario in ('idle', 'changing', 'full'):
+                result = run_scenario(gui, scenario, args.frames)
+                print(f"{gui_layout:>6} {bits_per_pixel:>4} {scenario:>9} {result['fps']:>9.1f} "
+                      f"{result['mean_ms']:>8.2f} {result['p95_ms']:>7.2f} {result['peak_kb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -60,7 +60,7 @@ if __name__ == "__main__":
     pwm_controller = PWMController(h, sensor_detect, PWM_pin=settings['pwm_pin'])
 
     # Instantiate other necessary components
-    redis_controller = RedisController()
+    redis_controller = RedisController(**settings.get('redis', {}))
 
     # Instantiate the CinePi instance
     cinepi_app = CinePi(redis_controller, sensor_detect)
@@ -127,7 +127,7 @@ if __name__ == "__main__":
     serial_handler = SerialHandler(command_executor.handle_received_data, 9600, log_queue=log_queue)
     serial_handler.start()
     
-    redis_listener = RedisListener(redis_controller)
+    redis_listener = RedisListener(redis_controller, ssd_monitor, **settings.get('frame_monitor', {}))
     
     simple_gui = SimpleGUI(pwm_controller, 
                            redis_controller, 
@@ -135,15 +135,16 @@ if __name__ == "__main__":
                            usb_monitor, 
                            ssd_monitor, 
                            serial_handler,
-                           dmesg_monitor
+                           dmesg_monitor,
+                           redis_listener=redis_listener,
+                           **settings.get('gui', {})
                            )
 
     # Log initialization complete message
     logging.info("--- initialization complete")
 
     try:
-        redis_controller.set_value('is_recording', 0)
-        redis_controller.set_value('is_writing', 0)
+        redis_controller.set_values({'is_recording': 0, 'is_writing': 0})
         # Pause program execution, keeping it running until interrupted
         pause()
     except Exception:
@@ -154,9 +155,7 @@ if __name__ == "__main__":
         pwm_controller.stop_pwm()
         pwm_controller.set_trigger_mode(0)
         # Reset redis values to default
-        redis_controller.set_value('fps', 24)
-        redis_controller.set_value('is_recording', 0)
-        redis_controller.set_value('is_writing', 0)
+        redis_controller.set_values({'fps': 24, 'is_recording': 0, 'is_writing': 0})
         
         # Set recording status to 0  
         gpio_output.set_recording(0)
@@ -1,6 +1,7 @@
 import subprocess
 import logging
-from queue import Queue
+import queue
+from collections import deque, namedtuple
 from threading import Thread
 
 class Event:
@@ -14,38 +15,112 @@ class Event:
         for listener in self._listeners:
             listener(data)
 
-def enqueue_output(out, queue, event):
+# A line of cinepi-raw output, decoded and classified once on the reader
+# thread. kind is 'error', 'warning', 'frame' or 'info'.
+CinePiMessage = namedtuple('CinePiMessage', ['stream', 'kind', 'text'])
+
+def classify_line(stream, line):
+    text = line.decode('utf-8', errors='replace').rstrip()
+    if ' ERROR ' in text or ' FATAL ' in text:
+        kind = 'error'
+    elif ' WARN ' in text:
+        kind = 'warning'
+    elif text.startswith('save frame'):
+        kind = 'frame'
+    else:
+        kind = 'info'
+    return CinePiMessage(stream, kind, text)
+
+class LineBuffer:
+    """The last maxlen lines of a stream, older lines are dropped and
+    counted"""
+
+    def __init__(self, maxlen):
+        self.lines = deque(maxlen=maxlen)
+        self.total = 0
+        self.dropped = 0
+
+    def append(self, message):
+        if len(self.lines) == self.lines.maxlen:
+            self.dropped += 1
+        self.lines.append(message)
+        self.total += 1
+
+def enqueue_output(out, stream, buffer, dispatch):
+    # Only reads and hands off, so a slow subscriber never stops the pipe
+    # from being drained and cinepi-raw from writing to it
     for line in iter(out.readline, b''):
-        queue.put(line)
-        # emit the line to all subscribers
-        event.emit(line.decode('utf-8'))
+        message = classify_line(stream, line)
+        buffer.append(message)
+        dispatch(message)
     out.close()
 
 class CinePi:
     _instance = None  # Singleton instance
 
-    def __new__(cls, redis_controller, sensor_detect):
+    def __new__(cls, redis_controller, sensor_detect, **kwargs):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
         return cls._instance
 
-    def __init__(self, redis_controller, sensor_detect):
+    def __init__(self, redis_controller, sensor_detect, history_lines=1000, dispatch_queue_size=256):
         if not hasattr(self, 'initialized'):  # only initialize once
             self.redis_controller = redis_controller
             self.sensor_detect = sensor_detect
             self.message = Event()
             self.suppress_output = False
             self.process = subprocess.Popen(['cinepi-raw'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            self.out_queue = Queue()
-            self.err_queue = Queue()
+
+            # Recent output of each stream, bounded
+            self.out_queue = LineBuffer(history_lines)
+            self.err_queue = LineBuffer(history_lines)
+
+            # Lines on their way to the message subscribers. When the
+            # subscribers fall behind the oldest pending line is dropped.
+            self.dispatch_queue = queue.Queue(maxsize=dispatch_queue_size)
+            self.dispatch_dropped = 0
 
             # These are the corrected positions for the thread initializations
-            self.out_thread = Thread(target=enqueue_output, args=(self.process.stdout, self.out_queue, self.message))
-            self.err_thread = Thread(target=enqueue_output, args=(self.process.stderr, self.err_queue, self.message))
-            
+            self.out_thread = Thread(target=enqueue_output, args=(self.process.stdout, 'stdout', self.out_queue, self.dispatch))
+            self.err_thread = Thread(target=enqueue_output, args=(self.process.stderr, 'stderr', self.err_queue, self.dispatch))
+            self.dispatch_thread = Thread(target=self.dispatch_loop)
+
             self.out_thread.daemon = True
             self.err_thread.daemon = True
+            self.dispatch_thread.daemon = True
+            self.dispatch_thread.start()
             self.out_thread.start()
-            self.err_thread.start()                        
+            self.err_thread.start()
             self.initialized = True  # indicate that the instance has been initialized
             logging.info('CinePi instantiated')
+
+    def dispatch(self, message):
+        """Queue a message for the subscribers without blocking the reader"""
+        while True:
+            try:
+                self.dispatch_queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.dispatch_queue.get_nowait()
+                    self.dispatch_dropped += 1
+                except queue.Empty:
+                    pass
+
+    def dispatch_loop(self):
+        while True:
+            message = self.dispatch_queue.get()
+            try:
+                self.message.emit(message)
+            except Exception as e:
+                logging.error(f"Error while handling cinepi-raw output: {e}")
+
+    def output_stats(self):
+        return {
+            'stdout_lines': self.out_queue.total,
+            'stdout_dropped': self.out_queue.dropped,
+            'stderr_lines': self.err_queue.total,
+            'stderr_dropped': self.err_queue.dropped,
+            'dispatch_pending': self.dispatch_queue.qsize(),
+            'dispatch_dropped': self.dispatch_dropped,
+        }
@@ -5,6 +5,20 @@ import time
 from fractions import Fraction
 import math
 
+class Event:
+    def __init__(self):
+        self._listeners = []
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def emit(self, *args):
+        for listener in self._listeners:
+            try:
+                listener(*args)
+            except Exception as e:
+                logging.error(f"Error while invoking listener: {e}")
+
 class CinePiController:
     def __init__(self,
                  pwm_controller, 
@@ -19,6 +33,10 @@ class CinePiController:
         
         self.parameters_lock_obj = threading.Lock()
         
+        # Emitted when controller state that is not mirrored in Redis changes
+        # (parameter lock, pwm mode, shutter sync, fps double, gui layout)
+        self.state_changed_event = Event()
+        
         self.pwm_controller = pwm_controller
         self.redis_controller = redis_controller
         self.ssd_monitor = ssd_monitor
@@ -46,7 +64,7 @@ class CinePiController:
         self.shutter_a_sync = True
         self.shutter_a_nom = 180
         
-        self.fps_saved = float(self.redis_controller.get_value('fps_actual'))
+        self.fps_saved = self.redis_controller.get_float('fps_actual')
         self.fps_double = False
         self.fps_actual = 24
         
@@ -54,13 +72,13 @@ class CinePiController:
         
         self.current_sensor = self.sensor_detect.camera_model
         
-        self.sensor_mode = int(self.redis_controller.get_value('sensor_mode'))
+        self.sensor_mode = self.redis_controller.get_int('sensor_mode')
         
         self.set_resolution(self.sensor_mode)
         self.fps_max = int(self.sensor_detect.get_fps_max(self.current_sensor, self.sensor_mode))
         self.gui_layout = (self.sensor_detect.get_gui_layout(self.current_sensor, self.sensor_mode))
         
-        self.exposure_time_s = float(self.redis_controller.get_value('shutter_a'))/360 * 1/self.fps_actual
+        self.exposure_time_s = self.redis_controller.get_float('shutter_a')/360 * 1/self.fps_actual
         self.exposure_time_saved = self.exposure_time_s
         
         self.file_size = self.sensor_detect.get_file_size(self.current_sensor, self.sensor_mode)
@@ -80,18 +98,22 @@ class CinePiController:
             
     def start_recording(self):
         if self.ssd_monitor.last_space_left:
-            self.redis_controller.set_value('is_recording', 1)
-            logging.info(f"Started recording")
+            if self.redis_controller.set_value('is_recording', 1):
+                logging.info(f"Started recording")
+            else:
+                logging.error(f"Could not start recording, Redis unreachable")
         elif not self.ssd_monitor.last_space_left:
             logging.info(f"No disk.")
             
     def stop_recording(self):
-        self.redis_controller.set_value('is_recording', 0)
-        logging.info(f"Stopped recording")
+        if self.redis_controller.set_value('is_recording', 0):
+            logging.info(f"Stopped recording")
+        else:
+            logging.error(f"Could not stop recording, Redis unreachable")
 
     def switch_resolution(self):
         try:
-            current_sensor_mode = int(self.redis_controller.get_value('sensor_mode'))
+            current_sensor_mode = self.redis_controller.get_int('sensor_mode')
             sensor_modes = list(self.sensor_detect.res_modes.keys())
             num_sensor_modes = len(sensor_modes)
 
@@ -121,15 +143,18 @@ class CinePiController:
             if height_value is None or width_value is None or gui_layout_value is None:
                 raise ValueError("Invalid height, width, or gui_layout value.")
 
-            # Set height, width, and gui_layout in Redis
-            self.redis_controller.set_value('height', str(height_value))
-            self.redis_controller.set_value('width', str(width_value))
-            self.redis_controller.set_value('sensor_mode', str(sensor_mode))
-            self.redis_controller.set_value('gui_layout', str(gui_layout_value))
-            self.redis_controller.set_value('cam_init', 1)
+            # Set height, width, and gui_layout in Redis, cam_init last
+            self.redis_controller.set_values({
+                'height': str(height_value),
+                'width': str(width_value),
+                'sensor_mode': str(sensor_mode),
+                'gui_layout': str(gui_layout_value),
+                'cam_init': 1,
+            }, transaction=True)
 
             # Update local attributes
             self.gui_layout = gui_layout_value
+            self.state_changed_event.emit()
 
             logging.info(f"Resolution set to mode {sensor_mode}, height: {height_value}, width: {width_value}, gui_layout: {gui_layout_value}")
 
@@ -137,16 +162,13 @@ class CinePiController:
             logging.error(f"Error setting resolution: {error}")
 
     def get_current_sensor_mode(self):
-        current_height = int(self.redis_controller.get_value('height'))
+        current_height = self.redis_controller.get_int('height')
 
         for mode, height_dict in self.sensor_detect.res_modes.items():
             if height_dict.get('height') == current_height:
-                # Update fps_max based on the current sensor mode
+                # Update fps_max and sensor_mode based on the current sensor mode
                 fps_max_value = height_dict.get('fps_max', None)
-                self.redis_controller.set_value('fps_max', fps_max_value)
-
-                # Update sensor_mode in Redis
-                self.redis_controller.set_value('sensor_mode', mode)
+                self.redis_controller.set_values({'fps_max': fps_max_value, 'sensor_mode': mode})
 
                 return mode
 
@@ -161,26 +183,26 @@ class CinePiController:
     def set_shutter_a(self, value):
         with self.parameters_lock_obj:
             self.redis_controller.set_value('shutter_a', value)
-            self.exposure_time_seconds = (float(self.redis_controller.get_value('shutter_a'))/360) / 1/self.fps_actual
+            self.exposure_time_seconds = (self.redis_controller.get_float('shutter_a')/360) / 1/self.fps_actual
             self.exposure_time_fractions = self.seconds_to_fraction_text(self.exposure_time_seconds)
  
             logging.info(f"Setting shutter_a to {value}")
             if self.pwm_mode == True:
                 self.pwm_controller.set_pwm(shutter_angle = value)
                 
-        self.exposure_time_s = float(self.redis_controller.get_value('shutter_a'))/360 * 1/self.fps_actual
+        self.exposure_time_s = self.redis_controller.get_float('shutter_a')/360 * 1/self.fps_actual
             
     def set_shutter_a_nom(self, value):
         with self.parameters_lock_obj:
             safe_value = max(1, min(value, 360))
             self.redis_controller.set_value('shutter_a_nom', value)
-            self.exposure_time_seconds = (float(self.redis_controller.get_value('shutter_a'))/360) / 1/self.fps_actual
+            self.exposure_time_seconds = (self.redis_controller.get_float('shutter_a')/360) / 1/self.fps_actual
             self.exposure_time_fractions = self.seconds_to_fraction_text(self.exposure_time_seconds)
  
             logging.info(f"Setting shutter_a_nom to {value}")
             
         if self.shutter_a_sync == True:
-            nominal_shutter_angle = float(self.redis_controller.get_value('shutter_a_nom'))
+            nominal_shutter_angle = self.redis_controller.get_float('shutter_a_nom')
             exposure_time_desired = (nominal_shutter_angle / 360) * (1/ self.fps_actual)
 
             synced_shutter_angle = (exposure_time_desired / (1/ self.fps_actual)) * 360
@@ -194,7 +216,7 @@ class CinePiController:
         elif self.shutter_a_sync == False:
             self.set_shutter_a(value)
             
-        self.exposure_time_s = float(self.redis_controller.get_value('shutter_a'))/360 * 1/self.fps_actual
+        self.exposure_time_s = self.redis_controller.get_float('shutter_a')/360 * 1/self.fps_actual
 
     def set_fps(self, value):
         # Determine max fps from resolution
@@ -211,12 +233,12 @@ class CinePiController:
         if not self.parameters_lock or self.lock_override == True:
             if self.pwm_mode == False and self.shutter_a_sync == False:
                 self.redis_controller.set_value('fps', safe_value)
-                self.fps_actual = float(self.redis_controller.get_value('fps'))
+                self.fps_actual = self.redis_controller.get_float('fps')
                 logging.info(f"Setting fps to {safe_value}")
 
             elif self.pwm_mode == False and self.shutter_a_sync == True:
                 self.redis_controller.set_value('fps', safe_value)
-                nominal_shutter_angle = float(self.get_setting('shutter_a_nom'))
+                nominal_shutter_angle = self.redis_controller.get_float('shutter_a_nom')
                 new_shutter_angle = self.exposure_time_saved / (1 / safe_value) * 360
                 new_shutter_angle = max(min(new_shutter_angle, 360), 1)
                 new_shutter_angle = round(new_shutter_angle, 1)
@@ -227,7 +249,7 @@ class CinePiController:
                 logging.info(f"Setting fps to {safe_value}")
 
             elif self.pwm_mode == True and self.shutter_a_sync == True:
-                nominal_shutter_angle = float(self.get_setting('shutter_a_nom'))
+                nominal_shutter_angle = self.redis_controller.get_float('shutter_a_nom')
                 new_shutter_angle = self.exposure_time_saved / (1 / safe_value) * 360
                 new_shutter_angle = max(min(new_shutter_angle, 360), 1)
                 new_shutter_angle = round(new_shutter_angle, 1)
@@ -239,12 +261,12 @@ class CinePiController:
                 logging.info(f"Setting fps to {safe_value} and shutter angle to {new_shutter_angle}")
 
             elif self.pwm_mode == True and self.shutter_a_sync == False:
-                new_shutter_angle = float(self.get_setting('shutter_a'))
+                new_shutter_angle = self.redis_controller.get_float('shutter_a')
                 self.pwm_controller.set_pwm(fps=safe_value, shutter_angle=new_shutter_angle)
                 self.fps_actual = safe_value
                 logging.info(f"Setting fps to {safe_value}")
 
-            self.exposure_time_s = (float(self.redis_controller.get_value('shutter_a')) / 360) / self.fps_actual
+            self.exposure_time_s = (self.redis_controller.get_float('shutter_a') / 360) / self.fps_actual
             self.exposure_time_fractions = self.seconds_to_fraction_text(self.exposure_time_s)
             self.redis_controller.set_value('fps_actual', self.fps_actual)
 
@@ -252,6 +274,7 @@ class CinePiController:
         with self.parameters_lock_obj:
             self.parameters_lock = value
             logging.info(f"Parameters lock {self.parameters_lock}")
+        self.state_changed_event.emit()
         
     def set_fps_multiplier(self, value):
         with self.parameters_lock_obj:
@@ -276,7 +299,7 @@ class CinePiController:
                 
     def increment_setting(self, setting_name, steps):
         if self.pwm_mode == False:
-            current_value = float(self.get_setting(setting_name))
+            current_value = self.redis_controller.get_float(setting_name)
             idx = steps.index(current_value)
             idx = min(idx + 1, len(steps) - 1)
             getattr(self, f"set_{setting_name}")(steps[idx])
@@ -286,7 +309,7 @@ class CinePiController:
 
     def decrement_setting(self, setting_name, steps):
         if self.pwm_mode == False:
-            current_value = float(self.get_setting(setting_name))
+            current_value = self.redis_controller.get_float(setting_name)
             idx = steps.index(current_value)
             idx = max(idx - 1, 0)
             getattr(self, f"set_{setting_name}")(steps[idx])
@@ -324,7 +347,7 @@ class CinePiController:
             logging.info(f"Current sensor {self.current_sensor}. PWM mode not available")
         else:
             if self.pwm_mode == False:
-                self.fps_saved = float(self.get_setting('fps_actual'))
+                self.fps_saved = self.redis_controller.get_float('fps_actual')
 
             self.pwm_mode = state
             logging.info(f"Setting pwm mode to {state}")
@@ -334,14 +357,15 @@ class CinePiController:
                 self.pwm_controller.stop_pwm()
                 self.set_fps(self.fps_saved)
             elif state == True:
-                self.fps_saved = float(self.get_setting('fps_actual'))
-                shutter_a_current = float(self.get_setting('shutter_a_nom'))
+                self.fps_saved = self.redis_controller.get_float('fps_actual')
+                shutter_a_current = self.redis_controller.get_float('shutter_a_nom')
                 self.redis_controller.set_value('fps', 50)
                 self.pwm_controller.start_pwm(int(self.fps_saved), shutter_a_current, 2)
 
             time.sleep(1)
             self.redis_controller.set_value('cam_init', 1)
             logging.info(f"Restarting camera")
+            self.state_changed_event.emit()
         
     # def set_pwm_mode(self, pwm_mode):
     #     if self.current_sensor != 'imx477':
@@ -372,13 +396,14 @@ class CinePiController:
         if shutter_a_sync == True:
             self.shutter_a_sync = True
             self.exposure_time_saved = self.exposure_time_s
-            self.set_shutter_a_nom(float(self.redis_controller.get_value('shutter_a_nom')))
+            self.set_shutter_a_nom(self.redis_controller.get_float('shutter_a_nom'))
         elif shutter_a_sync == False:
             self.shutter_a_sync = False
             self.exposure_time_saved = self.exposure_time_s
-            self.set_shutter_a_nom(float(self.redis_controller.get_value('shutter_a_nom')))
+            self.set_shutter_a_nom(self.redis_controller.get_float('shutter_a_nom'))
         
         logging.info(f"Shutter sync {self.shutter_a_sync}")
+        self.state_changed_event.emit()
         
     def switch_fps(self):
         if self.fps_double == False:
@@ -389,6 +414,8 @@ class CinePiController:
         elif self.fps_double == True:
             self.fps_double = False
             self.set_fps(int(self.fps_saved))
+            
+        self.state_changed_event.emit()
         
     def print_settings(self):
         iso = self.get_setting('iso')
@@ -433,14 +460,14 @@ class CinePiController:
             logging.error(f"Invalid white balance value: {wb_value}")
 
     def inc_wb(self):
-        current_wb = int(self.get_setting('wb'))
+        current_wb = self.redis_controller.get_int('wb')
         current_index = self.wb_steps.index(current_wb)
         if current_index < len(self.wb_steps) - 1:
             new_wb = self.wb_steps[current_index + 1]
             self.set_white_balance(new_wb)
 
     def dec_wb(self):
-        current_wb = int(self.get_setting('wb'))
+        current_wb = self.redis_controller.get_int('wb')
         current_index = self.wb_steps.index(current_wb)
         if current_index > 0:
             new_wb = self.wb_steps[current_index - 1]
@@ -457,12 +484,12 @@ class CinePiController:
         logging.info(f"Setting EV to {ev_value}")
 
     def inc_ev(self):
-        current_ev = float(self.get_setting('ev'))
+        current_ev = self.redis_controller.get_float('ev')
         new_ev = min(current_ev + 0.1, 2.0)  # Assuming max EV is 2.0
         self.set_ev(round(new_ev, 1))
 
     def dec_ev(self):
-        current_ev = float(self.get_setting('ev'))
+        current_ev = self.redis_controller.get_float('ev')
         new_ev = max(current_ev - 0.1, -2.0)  # Assuming min EV is -2.0
         self.set_ev(round(new_ev, 1))
 
@@ -5,6 +5,20 @@ import threading
 import time
 import os
 
+class Event:
+    def __init__(self):
+        self._listeners = []
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def emit(self, *args):
+        for listener in self._listeners:
+            try:
+                listener(*args)
+            except Exception as e:
+                logging.error(f"Error while invoking listener: {e}")
+
 class DmesgMonitor(threading.Thread):
     def __init__(self, dmesg_file):
         super().__init__()
@@ -20,6 +34,9 @@ class DmesgMonitor(threading.Thread):
         self.disk_attached = False
         self.disk_detached_event = threading.Event()
         
+        # Emitted with the new value whenever undervoltage_flag flips
+        self.undervoltage_event = Event()
+        
     def run(self):
         self._start_monitoring()
 
@@ -51,7 +68,9 @@ class DmesgMonitor(threading.Thread):
         pass
 
     def reset_undervoltage_flag(self):
-        self.undervoltage_flag = False
+        if self.undervoltage_flag:
+            self.undervoltage_flag = False
+            self.undervoltage_event.emit(False)
 
     def _start_monitoring(self):
         if not os.path.exists(self.dmesg_file):
@@ -95,9 +114,12 @@ class DmesgMonitor(threading.Thread):
                                 if not self.undervoltage_flag:
                                     logging.warning("Undervoltage detected!")
                                     self.undervoltage_flag = True
+                                    self.undervoltage_event.emit(True)
                             elif "Voltage_normalised" in message:
                                 logging.info("Voltage normalised")
-                                self.undervoltage_flag = False
+                                if self.undervoltage_flag:
+                                    self.undervoltage_flag = False
+                                    self.undervoltage_event.emit(False)
                             elif "sda" in message:
                                 if "[sda] Attached SCSI disk" in message:
                                     self.disk_attached = True
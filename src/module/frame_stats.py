@@ -0,0 +1,350 @@
+"""Frame timing of a take, from the framerate cinepi-raw reports on
+cp_stats for every frame (180000 samples for an hour at 50 fps).
+
+These accumulators update in constant time and memory per frame, so the
+take summary is ready the moment recording stops:
+
+RunningStats   count, mean, variance (Welford), min and max
+P2Quantile     one quantile estimated with the P-square algorithm (Jain and
+               Chlamtac, 1985) from five markers, no samples are kept
+FramerateStats the two combined, with median and p99
+GapTracker     dropped frames, their positions and the worst gaps, from
+               frame intervals against the nominal interval
+Histogram      sample counts per fixed-width bin
+
+For the detailed report the samples themselves are also kept in a
+FrameLog, preallocated numpy arrays at 25 bytes per frame, and
+analyze_frame_log computes percentile bands, jitter, drop runs and a
+rolling mean over them in a few vectorized passes.
+"""
+
+import heapq
+import math
+
+import numpy
+
+
+class RunningStats:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def variance(self):
+        """Sample variance, as statistics.variance"""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stdev(self):
+        return math.sqrt(self.variance)
+
+
+class P2Quantile:
+    def __init__(self, p):
+        self.p = p
+        self.initial = []
+        # marker heights, actual and desired positions, position increments
+        self.heights = None
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, value):
+        if self.heights is None:
+            self.initial.append(value)
+            if len(self.initial) == 5:
+                self.heights = sorted(self.initial)
+                self.initial = None
+            return
+
+        q, n = self.heights, self.positions
+        if value < q[0]:
+            q[0] = value
+            k = 0
+        elif value >= q[4]:
+            q[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # move the middle markers towards their desired positions
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < height < q[i + 1]:
+                    # parabolic step overshoots, fall back to linear
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    @property
+    def value(self):
+        if self.heights is not None:
+            return self.heights[2]
+        if not self.initial:
+            return None
+        # fewer than five samples, use them directly
+        samples = sorted(self.initial)
+        return samples[round(self.p * (len(samples) - 1))]
+
+
+class FramerateStats:
+    def __init__(self):
+        self.running = RunningStats()
+        self.median = P2Quantile(0.5)
+        self.p99 = P2Quantile(0.99)
+
+    @property
+    def count(self):
+        return self.running.count
+
+    def add(self, value):
+        self.running.add(value)
+        self.median.add(value)
+        self.p99.add(value)
+
+    def summary(self):
+        running = self.running
+        return {
+            'count': running.count,
+            'mean': running.mean if running.count else None,
+            'min': running.min,
+            'max': running.max,
+            'median': self.median.value,
+            'p99': self.p99.value,
+            'stdev': running.stdev,
+            'variance': running.variance,
+            'cv': running.stdev / running.mean if running.mean else None,
+        }
+
+
+class GapTracker:
+    """Counts dropped frames from frame intervals.
+
+    An interval longer than (1 + tolerance) nominal intervals means
+    round(interval / nominal) - 1 frames are missing before that frame.
+    Only the first max_positions drop positions and the `worst` longest
+    gaps are kept, so memory stays bounded.
+    """
+
+    def __init__(self, nominal_interval, tolerance=0.5, max_positions=1000, worst=10):
+        self.nominal_interval = nominal_interval
+        self.settle_interval = nominal_interval
+        self.settle_until = 0
+        self.tolerance = tolerance
+        self.max_positions = max_positions
+        self.worst = worst
+        self.frames = 0
+        self.gaps = 0
+        self.dropped = 0
+        self.positions = []
+        self.worst_gaps = []
+
+    def set_nominal_interval(self, interval, settle_frames=0):
+        """Switch to a new nominal interval when the framerate changes. For
+        the next settle_frames frames the sensor may still run at the old
+        rate, so the longer of the two intervals is the reference."""
+        self.settle_interval = max(self.nominal_interval, interval)
+        self.settle_until = self.frames + settle_frames
+        self.nominal_interval = interval
+
+    @property
+    def settling(self):
+        """True while the next frame may still come at the old rate"""
+        return self.frames < self.settle_until
+
+    @property
+    def reference_interval(self):
+        """Interval the next frame is compared with"""
+        if self.settling:
+            return self.settle_interval
+        return self.nominal_interval
+
+    def add(self, interval):
+        """Register the interval before the next frame, return the number
+        of frames dropped in it."""
+        reference = self.reference_interval
+        position = self.frames
+        self.frames += 1
+        if not reference or interval <= reference * (1 + self.tolerance):
+            return 0
+        dropped = max(round(interval / reference) - 1, 1)
+        self.gaps += 1
+        self.dropped += dropped
+        if len(self.positions) < self.max_positions:
+            self.positions.append(position)
+        gap = (interval, position)
+        if len(self.worst_gaps) < self.worst:
+            heapq.heappush(self.worst_gaps, gap)
+        elif gap > self.worst_gaps[0]:
+            heapq.heapreplace(self.worst_gaps, gap)
+        return dropped
+
+    def summary(self):
+        return {
+            'dropped': self.dropped,
+            'gaps': self.gaps,
+            'positions': list(self.positions),
+            'positions_truncated': self.gaps > len(self.positions),
+            'worst_gaps': [{'frame': position, 'interval_ms': round(interval, 3)}
+                           for interval, position in sorted(self.worst_gaps, reverse=True)],
+        }
+
+
+class Histogram:
+    def __init__(self, bin_width=0.5):
+        self.bin_width = bin_width
+        self.bins = {}
+
+    def add(self, value):
+        key = round(value / self.bin_width) * self.bin_width
+        self.bins[key] = self.bins.get(key, 0) + 1
+
+    def summary(self):
+        return {f"{key:g}": self.bins[key] for key in sorted(self.bins)}
+
+
+class FrameLog:
+    """Arrival time, reported framerate and nominal interval of every frame
+    of a take.
+
+    Starts at `capacity` frames and doubles when full. Once max_frames is
+    reached it turns into a ring buffer and the oldest frames are
+    overwritten, `first_frame` tells how many were lost that way.
+    """
+
+    def __init__(self, capacity=4096, max_frames=720000):
+        self.max_frames = max_frames
+        self.times = numpy.empty(min(capacity, max_frames))
+        self.framerates = numpy.empty(min(capacity, max_frames))
+        self.nominal = numpy.empty(min(capacity, max_frames))
+        self.settling = numpy.empty(min(capacity, max_frames), dtype=bool)
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, len(self.times))
+
+    @property
+    def first_frame(self):
+        return self.count - len(self)
+
+    def add(self, timestamp, framerate, nominal_interval, settling=False):
+        """nominal_interval is the interval in ms the frame is judged
+        against, 0 if unknown. settling marks frames right after an fps
+        change."""
+        size = len(self.times)
+        if self.count == size and size < self.max_frames:
+            size = min(size * 2, self.max_frames)
+            self.times = numpy.resize(self.times, size)
+            self.framerates = numpy.resize(self.framerates, size)
+            self.nominal = numpy.resize(self.nominal, size)
+            self.settling = numpy.resize(self.settling, size)
+        index = self.count % size
+        self.times[index] = timestamp
+        self.framerates[index] = framerate
+        self.nominal[index] = nominal_interval
+        self.settling[index] = settling
+        self.count += 1
+
+    def arrays(self):
+        """Times, framerates, nominal intervals and settling flags in frame
+        order"""
+        arrays = (self.times, self.framerates, self.nominal, self.settling)
+        if self.count <= len(self.times):
+            return tuple(array[:self.count] for array in arrays)
+        index = self.count % len(self.times)
+        return tuple(numpy.concatenate((array[index:], array[:index])) for array in arrays)
+
+
+def analyze_frame_log(frame_log, tolerance=0.5,
+                      percentiles=(1, 5, 25, 50, 75, 95, 99), max_runs=100):
+    """Per-frame analysis of a take from its FrameLog, on top of the
+    FramerateStats summary.
+
+    Frame intervals are derived from the reported framerates and compared
+    with each frame's own nominal interval, so fps changes during the take
+    are followed. Intervals longer than (1 + tolerance) nominal intervals
+    are drops, consecutive ones form a drop run. Frames without a nominal
+    interval are left out of drop and jitter figures, settling frames out
+    of jitter. Jitter is the spread of the remaining intervals around
+    their nominal one. The rolling mean framerate is taken over one second
+    of frames and sampled once per second.
+    """
+    times, framerates, nominal, settling = frame_log.arrays()
+    first_frame = frame_log.first_frame
+    valid = framerates > 0
+    framerates = framerates[valid]
+    times = times[valid]
+    nominal = nominal[valid]
+    settling = settling[valid]
+    frames = numpy.flatnonzero(valid) + first_frame
+    count = len(framerates)
+    if count == 0:
+        return None
+
+    bands = numpy.percentile(framerates, percentiles)
+    result = {
+        'percentiles': {f"p{p:g}": round(float(value), 3) for p, value in zip(percentiles, bands)},
+        'frames_overwritten': first_frame,
+    }
+
+    intervals = 1000 / framerates
+    known = nominal > 0
+    if known.any():
+        late = known & (intervals > nominal * (1 + tolerance))
+        ratio = numpy.divide(intervals, nominal, out=numpy.zeros_like(intervals), where=known)
+        lost = numpy.maximum(numpy.rint(ratio) - 1, 1) * late
+        on_time = known & ~late & ~settling
+        deviation = intervals[on_time] - nominal[on_time]
+        result['jitter'] = {
+            'stdev_ms': round(float(deviation.std()), 3) if len(deviation) else None,
+            'mean_abs_ms': round(float(numpy.abs(deviation).mean()), 3) if len(deviation) else None,
+            'max_abs_ms': round(float(numpy.abs(deviation).max()), 3) if len(deviation) else None,
+        }
+
+        # run boundaries are where the late flag changes
+        edges = numpy.diff(numpy.concatenate(([0], late.astype(numpy.int8), [0])))
+        starts = numpy.flatnonzero(edges == 1)
+        ends = numpy.flatnonzero(edges == -1)
+        lost_sum = numpy.concatenate(([0], numpy.cumsum(lost)))
+        runs_lost = lost_sum[ends] - lost_sum[starts]
+        result['frames_dropped'] = int(lost_sum[-1])
+        result['drop_runs'] = [
+            {'frame': int(frames[start]), 'length': int(end - start), 'frames_lost': int(run_lost)}
+            for start, end, run_lost in zip(starts[:max_runs], ends[:max_runs], runs_lost[:max_runs])]
+        result['drop_runs_truncated'] = len(starts) > max_runs
+
+    if len(times) > 1:
+        result['arrival_jitter_ms'] = round(float(numpy.diff(times).std() * 1000), 3)
+
+    window = max(int(round(framerates.mean())), 1)
+    if count >= window:
+        sums = numpy.cumsum(numpy.concatenate(([0.0], framerates)))
+        rolling = (sums[window:] - sums[:-window]) / window
+        result['rolling_mean'] = numpy.round(rolling[::window], 3).tolist()
+    else:
+        result['rolling_mean'] = []
+    return result
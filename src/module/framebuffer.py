@@ -7,8 +7,18 @@ bits_per_pixel    assumed memory layout
 16                rgb565
 24                rgb
 32                argb
+
+With double_buffer=True and a driver exposing a virtual height of at least
+twice the visible height, frames are drawn into the hidden half of the
+mapping and shown by panning the display (FBIOPAN_DISPLAY), so the screen
+never shows a half written frame.
 """
 
+import fcntl
+import mmap
+import os
+import struct
+
 from PIL import Image
 import numpy
 
@@ -20,41 +30,69 @@ def _read_and_convert_to_ints(filename):
         return [int(t) for t in tokens if t]
 
 
-def _converter_argb(image: Image):
-    return bytes([x for r, g, b in image.getdata() for x in (255, r, g, b)])
+# linux/fb.h
+FBIOGET_VSCREENINFO = 0x4600
+FBIOPAN_DISPLAY = 0x4606
+# struct fb_var_screeninfo is 40 __u32, the first six being
+# xres, yres, xres_virtual, yres_virtual, xoffset, yoffset
+_VSCREENINFO = struct.Struct("40I")
+
+
+def _pixels(image: Image, channels: int):
+    return numpy.frombuffer(image.tobytes(), dtype=numpy.uint8).reshape(-1, channels)
+
+
+# All converters take the image and a preallocated uint8 output array of
+# exactly the converted size, and return the converted bytes as a flat array.
+
+def _converter_argb(image: Image, out):
+    rgb = _pixels(image, 3)
+    argb = out.reshape(-1, 4)
+    argb[:, 0] = 255
+    argb[:, 1:] = rgb
+    return out
+
 
+def _converter_rgb565(image: Image, out):
+    rgb = _pixels(image, 3).astype(numpy.uint16)
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    out.view(numpy.uint16)[:] = ((r & 0xf8) << 8) | ((g & 0xfc) << 3) | (b >> 3)
+    return out
 
-def _converter_rgb565(image: Image):
-    return bytes([x for r, g, b in image.getdata()
-                  for x in ((g & 0x1c) << 3 | (b >> 3), r & 0xf8 | (g >> 3))])
 
+# numpy does not work well with mode="1" images as image.tobytes() packs
+# eight pixels per byte, so go through "L" to get one 0/255 byte per pixel
 
-def _converter_1_argb(image: Image):
-    return bytes([x for p in image.getdata()
-                  for x in (255, p, p, p)])
+def _converter_1_argb(image: Image, out):
+    p = _pixels(image.convert("L"), 1)
+    argb = out.reshape(-1, 4)
+    argb[:, 0] = 255
+    argb[:, 1:] = p
+    return out
 
 
-def _converter_1_rgb(image: Image):
-    return bytes([x for p in image.getdata()
-                  for x in (p, p, p)])
+def _converter_1_rgb(image: Image, out):
+    out.reshape(-1, 3)[:] = _pixels(image.convert("L"), 1)
+    return out
 
 
-def _converter_1_rgb565(image: Image):
-    return bytes([(255 if x else 0) for p in image.getdata()
-                  for x in (p, p)])
+def _converter_1_rgb565(image: Image, out):
+    out.reshape(-1, 2)[:] = _pixels(image.convert("L"), 1)
+    return out
 
 
-def _converter_rgba_rgb565_numpy(image: Image):
+def _converter_rgba_rgb565_numpy(image: Image, out):
     flat = numpy.frombuffer(image.tobytes(), dtype=numpy.uint32)
     # note,  this is assumes little endian byteorder and results in
     # the following packing of an integer:
     # bits 0-7: red, 8-15: green, 16-23: blue, 24-31: alpha
-    flat = ((flat & 0xf8) << 8) | ((flat & 0xfc00) >> 5) | ((flat & 0xf80000) >> 19)
-    return flat.astype(numpy.uint16).tobytes()
+    out.view(numpy.uint16)[:] = ((flat & 0xf8) << 8) | ((flat & 0xfc00) >> 5) | ((flat & 0xf80000) >> 19)
+    return out
 
 
-def _converter_no_change(image: Image):
-    return image.tobytes()
+def _converter_no_change(image: Image, out):
+    # already in display layout, skip the extra copy into out
+    return numpy.frombuffer(image.tobytes(), dtype=numpy.uint8)
 
 # anything that does not use numpy is hopelessly slow
 _CONVERTER = {
@@ -63,8 +101,6 @@ _CONVERTER = {
     ("RGB", 24): _converter_no_change,
     ("RGB", 32): _converter_argb,
     ("RGBA", 32): _converter_no_change,
-    # note numpy does not work well with mode="1" images as
-    # image.tobytes() loses pixel color info
     ("1", 16): _converter_1_rgb565,
     ("1", 24): _converter_1_rgb,
     ("1", 32): _converter_1_argb,
@@ -73,8 +109,17 @@ _CONVERTER = {
 
 class Framebuffer(object):
 
-    def __init__(self, device_no: int):
+    def __init__(self, device_no: int, use_mmap: bool = False, double_buffer: bool = False):
         self.path = f"/dev/fb{device_no}"
+        self.mmap = None
+        self._fd = None
+        self._rows = None
+        self._out = None
+        self.double_buffered = False
+        self._pages = None
+        self._front = 0
+        self._vinfo = None
+        self._last_rects = []
         config_dir = f"/sys/class/graphics/fb{device_no}"
         try:
             self.size = tuple(_read_and_convert_to_ints(
@@ -88,6 +133,16 @@ class Framebuffer(object):
             self.size = (0, 0)
             self.stride = 0
             self.bits_per_pixel = 0
+        self.virtual_height = self.size[1]
+
+        if double_buffer and self.size != (0, 0):
+            if use_mmap:
+                self._probe_double_buffer()
+            else:
+                print("Double buffering needs use_mmap, using a single buffer")
+
+        if use_mmap and self.size != (0, 0):
+            self.open_mmap()
 
     # def __init__(self, device_no: int):
     #     self.path = f"/dev/fb{device_no}"
@@ -103,13 +158,160 @@ class Framebuffer(object):
         args = (self.path, self.size, self.stride, self.bits_per_pixel)
         return "%s  size:%s  stride:%s  bits_per_pixel:%s" % args
 
-    # Note: performance is terrible even for medium resolutions
-    def show(self, image: Image):
+    def _probe_double_buffer(self):
+        """Switch to the visible size if the virtual screen holds two of it"""
+        try:
+            with open(self.path, "rb") as fp:
+                vinfo = bytearray(_VSCREENINFO.size)
+                fcntl.ioctl(fp, FBIOGET_VSCREENINFO, vinfo)
+        except OSError as e:
+            print(f"Could not query {self.path}, using a single buffer: {e}")
+            return
+        xres, yres, xres_virtual, yres_virtual = _VSCREENINFO.unpack(vinfo)[:4]
+        if xres_virtual != xres or yres_virtual < 2 * yres:
+            print(f"Virtual size {xres_virtual}x{yres_virtual} has no room for a "
+                  f"second {xres}x{yres} buffer, using a single buffer")
+            return
+        self.size = (xres, yres)
+        self.virtual_height = yres_virtual
+        self._vinfo = vinfo
+        self.double_buffered = True
+
+    def open_mmap(self):
+        """Keep the device mapped for the lifetime of this object"""
+        try:
+            self._fd = os.open(self.path, os.O_RDWR)
+            self.mmap = mmap.mmap(self._fd, self.stride * self.virtual_height,
+                                  mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            # rows of the mapping, so regions are copied with one assignment
+            self._rows = numpy.frombuffer(self.mmap, dtype=numpy.uint8).reshape(-1, self.stride)
+            if self.double_buffered:
+                height = self.size[1]
+                self._pages = (self._rows[:height], self._rows[height:2 * height])
+                self._pan(0)
+                self._rows = self._pages[1]
+        except OSError as e:
+            print(f"Could not mmap {self.path}, falling back to writes: {e}")
+            self.close()
+            if self.double_buffered:
+                self.double_buffered = False
+                self.virtual_height = self.size[1]
+
+    def _pan(self, page):
+        """Make page (0 or 1) the one being scanned out"""
+        vinfo = _VSCREENINFO.unpack(self._vinfo)
+        vinfo = vinfo[:4] + (0, page * self.size[1]) + vinfo[6:]
+        _VSCREENINFO.pack_into(self._vinfo, 0, *vinfo)
+        fcntl.ioctl(self._fd, FBIOPAN_DISPLAY, self._vinfo)
+        self._front = page
+
+    def flip(self):
+        """Show the back buffer and start drawing into the other one.
+
+        The new back buffer still holds the frame before last; present()
+        takes care of bringing it up to date.
+        """
+        self._pan(1 - self._front)
+        self._rows = self._pages[1 - self._front]
+
+    def close(self):
+        if self._pages is not None and self._fd is not None and self._front != 0:
+            # leave the console on the page it started on
+            try:
+                self._pan(0)
+            except OSError:
+                pass
+        self._pages = None
+        self._rows = None
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def convert(self, image: Image):
+        """Convert image to the display pixel layout as a flat uint8 array.
+
+        The result lives in a buffer owned by the framebuffer and is only
+        valid until the next call.
+        """
         converter = _CONVERTER[(image.mode, self.bits_per_pixel)]
+        nbytes = image.size[0] * image.size[1] * self.bits_per_pixel // 8
+        if self._out is None or len(self._out) < nbytes:
+            self._out = numpy.empty(max(nbytes, self.stride * self.size[1]), dtype=numpy.uint8)
+        return converter(image, self._out[:nbytes])
+
+    def to_native(self, image: Image):
+        """Return image as a new (height, width, bytes_per_pixel) uint8 array
+        in the display pixel layout, e.g. to allocate a native canvas.
+
+        Uses the same converter the GUI has always gone through for its
+        RGBA frames, so colours come out identical.
+        """
+        mode = "RGBA" if ("RGBA", self.bits_per_pixel) in _CONVERTER else "RGB"
+        if image.mode != mode:
+            image = image.convert(mode)
+        width, height = image.size
+        return numpy.array(self.convert(image)).reshape(height, width, self.bits_per_pixel // 8)
+
+    def _write_rows(self, rows, x0, y0):
+        """Copy rows (a (height, row_bytes) array) to the display at x0, y0"""
+        offset = x0 * self.bits_per_pixel // 8
+        if self._rows is not None:
+            self._rows[y0:y0 + rows.shape[0], offset:offset + rows.shape[1]] = rows
+            return
+        offset += y0 * self.stride
+        with open(self.path, "r+b") as fp:
+            if rows.shape[1] == self.stride:
+                fp.seek(offset)
+                fp.write(numpy.ascontiguousarray(rows))
+                return
+            for row in rows:
+                fp.seek(offset)
+                fp.write(row)
+                offset += self.stride
+
+    def show(self, image: Image, rect=None):
+        """Push image to the display.
+
+        rect is an optional (x0, y0, x1, y1) region of image; only the rows
+        of that region are copied into the framebuffer.
+        """
         assert image.size == self.size
-        out = converter(image)
-        with open(self.path, "wb") as fp:
-            fp.write(out)
+        x0, y0, x1, y1 = rect or (0, 0) + self.size
+        if (x0, y0, x1, y1) != (0, 0) + self.size:
+            image = image.crop((x0, y0, x1, y1))
+        out = self.convert(image)
+        self._write_rows(out.reshape(y1 - y0, -1), x0, y0)
+
+    def blit(self, canvas, rect=None):
+        """Push a region of a canvas that is already in the display pixel
+        layout (see to_native), so no conversion takes place.
+
+        canvas is a (height, width, bytes_per_pixel) uint8 array of self.size.
+        """
+        x0, y0, x1, y1 = rect or (0, 0) + self.size
+        self._write_rows(canvas[y0:y1, x0:x1].reshape(y1 - y0, -1), x0, y0)
+
+    def present(self, canvas, rects):
+        """Push the changed rects of a native canvas to the display.
+
+        Single buffered the rects are copied into visible memory. Double
+        buffered they are copied into the back buffer together with the
+        rects of the previous frame, which that buffer has not seen yet, and
+        the buffers are flipped.
+        """
+        if not self.double_buffered:
+            for rect in rects:
+                self.blit(canvas, rect)
+            return
+        if not rects:
+            return
+        for rect in self._last_rects + list(rects):
+            self.blit(canvas, rect)
+        self.flip()
+        self._last_rects = list(rects)
 
     def on(self):
         pass
@@ -117,25 +319,62 @@ class Framebuffer(object):
     def off(self):
         pass
 
-# if __name__ == "__main__":
-#     import time
-#     from PIL import ImageDraw
-
-
-#     def TestFrameBuffer(i):
-#         fb = Framebuffer(i)
-#         print(fb)
-#         image = Image.new("RGBA", fb.size)
-#         draw = ImageDraw.Draw(image)
-#         draw.rectangle(((0, 0), fb.size), fill="green")
-#         draw.ellipse(((0, 0), fb.size), fill="blue", outline="red")
-#         draw.line(((0, 0), fb.size), fill="green", width=2)
-#         start = time.time()
-#         for i in range(5):
-#             fb.show(image)
-#         stop = time.time()
-#         print("fps: %.2f" % (10 / (stop - start)))
-
 
-#     for i in [0]:
-#         TestFrameBuffer(i)
+class OffscreenFramebuffer(Framebuffer):
+    """Framebuffer with the same API backed by memory or a regular file
+    instead of /dev/fbN, for running and benchmarking the GUI without a
+    display. The pixels written so far are available in self.pixels."""
+
+    def __init__(self, size=(1920, 1080), bits_per_pixel: int = 16, path: str = None):
+        self.path = path or "<memory>"
+        self.mmap = None
+        self._fd = None
+        self._out = None
+        self.double_buffered = False
+        self._pages = None
+        self._front = 0
+        self._vinfo = None
+        self._last_rects = []
+        self.size = tuple(size)
+        self.virtual_height = self.size[1]
+        self.bits_per_pixel = bits_per_pixel
+        self.stride = bits_per_pixel // 8 * self.size[0]
+        if path is None:
+            self._rows = numpy.zeros((self.size[1], self.stride), dtype=numpy.uint8)
+        else:
+            with open(path, "wb") as fp:
+                fp.truncate(self.stride * self.size[1])
+            self._rows = None
+            self.open_mmap()
+
+    @property
+    def pixels(self):
+        return self._rows.reshape(self.size[1], self.size[0], self.bits_per_pixel // 8)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from PIL import ImageDraw
+
+    # Converter micro-benchmark: python3 framebuffer.py [device_no] [repeat]
+    def BenchmarkConverters(device_no, repeat):
+        fb = Framebuffer(device_no)
+        print(fb)
+        size = fb.size if fb.size != (0, 0) else (1920, 1080)
+        for (mode, bits_per_pixel), converter in _CONVERTER.items():
+            image = Image.new(mode, size)
+            draw = ImageDraw.Draw(image)
+            draw.ellipse(((0, 0), size), fill="white")
+            draw.line(((0, 0), size), fill="black", width=2)
+            out = numpy.empty(size[0] * size[1] * bits_per_pixel // 8, dtype=numpy.uint8)
+            converter(image, out)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                converter(image, out)
+            stop = time.perf_counter()
+            print("%-4s -> %2d bpp  %dx%d  %8.2f ms/frame" % (
+                mode, bits_per_pixel, size[0], size[1], (stop - start) * 1000 / repeat))
+
+    BenchmarkConverters(int(sys.argv[1]) if len(sys.argv) > 1 else 0,
+                        int(sys.argv[2]) if len(sys.argv) > 2 else 20)
@@ -32,7 +32,7 @@ class GPIOInput:
         self.buttons = {}
 
         self.fps_button_inverse = False
-        self.fps_original = float(self.redis_controller.get_value('fps_actual'))
+        self.fps_original = self.redis_controller.get_float('fps_actual')
         self.fps_temp = 24
         self.fps_double = False
         self.ramp_up_speed = 0.1
@@ -122,9 +122,9 @@ class GPIOInput:
         if fps_button_state_old and fps_button_state_old != self.cinepi_controller.fps_button_state:
             if not self.cinepi_controller.pwm_mode:
                 if not self.fps_double:
-                    self.fps_temp = float(self.redis_controller.get_value('fps_actual'))
+                    self.fps_temp = self.redis_controller.get_float('fps_actual')
                     fps_new = self.fps_temp * 2
-                    fps_max = float(self.redis_controller.get_value('fps_max', default=50))
+                    fps_max = self.redis_controller.get_float('fps_max', default=50)
                     fps_new = min(fps_new, fps_max)
                     self.cinepi_controller.set_fps(fps_new)
                     self.fps_double = True
@@ -133,22 +133,22 @@ class GPIOInput:
                     self.fps_double = False
             else:
                 if not self.fps_double:
-                    self.fps_temp = float(self.redis_controller.get_value('fps_actual'))
+                    self.fps_temp = self.redis_controller.get_float('fps_actual')
                     fps_target = self.fps_temp * 2
-                    fps_max = float(self.redis_controller.get_value('fps_max', default=50))
+                    fps_max = self.redis_controller.get_float('fps_max', default=50)
                     fps_target = min(fps_target, fps_max)
 
-                    while float(self.redis_controller.get_value('fps_actual')) < int(float(self.redis_controller.get_value('fps_max'))):
+                    while self.redis_controller.get_float('fps_actual') < int(self.redis_controller.get_float('fps_max')):
                         logging.info('ramping up')
-                        fps_current = float(self.redis_controller.get_value('fps_actual'))
+                        fps_current = self.redis_controller.get_float('fps_actual')
                         fps_next = fps_current + 1
                         self.cinepi_controller.set_fps(int(fps_next))
                         time.sleep(self.ramp_up_speed)
                     self.fps_double = True
                 else:
-                    while float(self.redis_controller.get_value('fps_actual')) > self.fps_temp:
+                    while self.redis_controller.get_float('fps_actual') > self.fps_temp:
                         logging.info('ramping down')
-                        fps_current = float(self.redis_controller.get_value('fps_actual'))
+                        fps_current = self.redis_controller.get_float('fps_actual')
                         fps_next = fps_current - 1
                         self.cinepi_controller.set_fps(int(fps_next))
                         time.sleep(self.ramp_down_speed)
@@ -0,0 +1,215 @@
+"""Retained-mode compositor for the Simple GUI.
+
+Every HUD element (ISO, shutter, FPS, MIN left, CPU load/temp, flags...) is a
+Widget that remembers where it was last drawn. The GUI hands the compositor
+the widgets it wants on screen for the current frame; only the widgets whose
+text, font, colour or position changed are cleared and re-rasterized, and
+the compositor returns the screen rectangles that need to be pushed to the
+framebuffer. Cleared areas are restored from a precomputed background layer.
+
+The frame is kept as a NumPy canvas in the framebuffer's own pixel layout
+(rgb565, rgb or 32 bit), so pushing a region to the display is a plain copy.
+Text is blended straight into that layout through a 256 entry lookup table
+per (text colour, background colour), built once with the same converter the
+framebuffer uses.
+
+Fonts are loaded once per (path, size) for the whole process, and rendered
+strings are kept as alpha masks in an LRU cache, so recurring labels such as
+"ISO 800", "SYNC" or "NO DISK" are rasterized once and then only pasted.
+"""
+
+import functools
+import os
+from collections import OrderedDict
+
+import numpy
+from PIL import Image, ImageDraw, ImageFont
+
+
+@functools.lru_cache(maxsize=None)
+def _load_font(path, size):
+    return ImageFont.truetype(path, size)
+
+
+def get_font(path, size):
+    """Return a shared FreeType font, parsing the file only the first time."""
+    return _load_font(os.path.realpath(path), size)
+
+
+def _intersects(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _contains(outer, inner):
+    return (outer[0] <= inner[0] and outer[1] <= inner[1]
+            and outer[2] >= inner[2] and outer[3] >= inner[3])
+
+
+class TextCache:
+    """LRU cache of rendered strings as (offset, uint8 alpha mask) pairs."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, font, text):
+        key = (getattr(font, 'path', None), getattr(font, 'size', None), text)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        left, top, right, bottom = font.getbbox(text)
+        mask = Image.new("L", (max(right - left, 0), max(bottom - top, 0)))
+        ImageDraw.Draw(mask).text((-left, -top), text, font=font, fill=255)
+        entry = ((left, top), numpy.array(mask))
+        self._entries[key] = entry
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return entry
+
+
+class Widget:
+    def __init__(self, xy, text, font, fill):
+        self.xy = xy
+        self.text = str(text)
+        self.font = font
+        self.fill = fill
+        self.bbox = None
+
+    @property
+    def state(self):
+        # Fonts are compared by file and size, so an equivalent font object
+        # does not force a redraw.
+        font_key = (getattr(self.font, 'path', None), getattr(self.font, 'size', None))
+        return (self.xy, self.text, font_key, self.fill)
+
+
+def _rgba_native(image):
+    return numpy.array(image.convert("RGBA"))
+
+
+class Compositor:
+    def __init__(self, size, to_native=None):
+        """to_native converts a PIL image into a (height, width, bytes)
+        uint8 array in the display layout (Framebuffer.to_native); without
+        it the canvas is plain RGBA."""
+        self.size = tuple(size)
+        self.to_native = to_native or _rgba_native
+        self.canvas = self.to_native(Image.new("RGB", self.size))
+        self.text_cache = TextCache()
+        self.background = None
+        self.native_background = None
+        self._native_layers = {}
+        self._luts = {}
+        self.widgets = {}
+
+    def invalidate(self):
+        """Force a full repaint on the next update."""
+        self.background = None
+
+    def _clip(self, rect):
+        x0, y0, x1, y1 = rect
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.size[0]), min(y1, self.size[1])
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return (x0, y0, x1, y1)
+
+    def _native_layer(self, background):
+        # keyed by id, holding on to the image so the id stays unique
+        entry = self._native_layers.get(id(background))
+        if entry is None:
+            if len(self._native_layers) >= 8:
+                self._native_layers.clear()
+            entry = self._native_layers[id(background)] = (background, self.to_native(background))
+        return entry[1]
+
+    def _lut(self, fill, background_color):
+        """Display pixels for fill blended over background_color at every
+        alpha level, blended by PIL exactly as draw.text would."""
+        key = (fill, background_color)
+        lut = self._luts.get(key)
+        if lut is None:
+            ramp = Image.new("RGBA", (256, 1), background_color)
+            ramp.paste(fill, (0, 0), Image.frombytes("L", (256, 1), bytes(range(256))))
+            lut = self._luts[key] = self.to_native(ramp)[0]
+        return lut
+
+    def _measure(self, widget):
+        (left, top), mask = self.text_cache.get(widget.font, widget.text)
+        x0, y0 = widget.xy[0] + left, widget.xy[1] + top
+        return (x0, y0, x0 + mask.shape[1], y0 + mask.shape[0])
+
+    def _render(self, widget):
+        bbox = self._clip(widget.bbox)
+        if not bbox:
+            return
+        (left, top), mask = self.text_cache.get(widget.font, widget.text)
+        x0, y0, x1, y1 = bbox
+        ox, oy = widget.xy[0] + left, widget.xy[1] + top
+        alpha = mask[y0 - oy:y1 - oy, x0 - ox:x1 - ox]
+        lut = self._lut(widget.fill, self.background.getpixel((x0, y0)))
+        region = self.canvas[y0:y1, x0:x1]
+        ink = alpha > 0
+        region[ink] = lut[alpha[ink]]
+
+    def update(self, widgets, background):
+        """Composite widgets (name -> Widget) over a static background layer.
+
+        background is an RGB(A) image of the compositor size; handing over a
+        different layer repaints the whole frame. Returns the list of
+        (x0, y0, x1, y1) rectangles of the canvas that changed.
+        """
+        if background is not self.background:
+            self.background = background
+            self.native_background = self._native_layer(background)
+            self.canvas[...] = self.native_background
+            for widget in widgets.values():
+                widget.bbox = self._measure(widget)
+                self._render(widget)
+            self.widgets = widgets
+            full = self._clip((0, 0) + self.size)
+            return [full] if full else []
+
+        dirty = []
+        for name, old in self.widgets.items():
+            new = widgets.get(name)
+            if new is None or new.state != old.state:
+                dirty.append(old.bbox)
+        for name, new in widgets.items():
+            old = self.widgets.get(name)
+            if old is None or new.state != old.state:
+                new.bbox = self._measure(new)
+                dirty.append(new.bbox)
+            else:
+                new.bbox = old.bbox
+        self.widgets = widgets
+
+        dirty = [rect for rect in map(self._clip, dirty) if rect]
+        if not dirty:
+            return []
+
+        # Unchanged widgets overlapping a cleared area must be redrawn in
+        # full, so grow the dirty set until it covers them completely.
+        grown = True
+        while grown:
+            grown = False
+            for widget in widgets.values():
+                bbox = self._clip(widget.bbox)
+                if bbox and bbox not in dirty and any(_intersects(bbox, rect) for rect in dirty) \
+                        and not any(_contains(rect, bbox) for rect in dirty):
+                    dirty.append(bbox)
+                    grown = True
+
+        for x0, y0, x1, y1 in dirty:
+            self.canvas[y0:y1, x0:x1] = self.native_background[y0:y1, x0:x1]
+        for widget in widgets.values():
+            bbox = self._clip(widget.bbox)
+            if bbox and any(_intersects(bbox, rect) for rect in dirty):
+                self._render(widget)
+        return dirty
@@ -15,14 +15,15 @@ class Mediator:
         self.usb_monitor.usb_event.subscribe(self.handle_usb_event)
         self.ssd_monitor.write_status_changed_event.subscribe(self.handle_write_status_change)
 
-        # Subscribe to the "is_recording" key changes
-        self.redis_controller.redis_parameter_changed.subscribe(self.handle_redis_event)
+        # Subscribe to the "is_recording" and "is_writing" key changes
+        self.redis_controller.redis_parameter_changed.subscribe(self.handle_redis_event,
+                                                                keys=('is_recording', 'is_writing'))
         
         self.stop_recording_timer = None
         self.stop_recording_timeout = 2
         
          # Subscribe to the "fps_actual" key changes
-        self.redis_controller.redis_parameter_changed.subscribe(self.handle_fps_actual_change)
+        self.redis_controller.redis_parameter_changed.subscribe(self.handle_fps_actual_change, keys='fps_actual')
         
          # Subscribe to SSD unmount events
         self.ssd_monitor.unmount_event.subscribe(self.handle_ssd_unmount)
@@ -49,8 +50,7 @@ class Mediator:
         self.recording_stop()
 
     def recording_stop(self):
-        self.redis_controller.set_value('is_recording', 0)
-        self.redis_controller.set_value('is_writing', 0)
+        self.redis_controller.set_values({'is_recording': 0, 'is_writing': 0})
         self.gpio_output.set_recording(0)        
 
     def handle_write_status_change(self, status):
@@ -94,23 +94,20 @@ class Mediator:
 
     def handle_stop_recording_timeout(self):
         """Handle the timeout event when recording should be stopped."""
-        self.redis_controller.set_value('is_writing_buf', 0)
-        self.redis_controller.set_value('is_recording', 0)
-        self.redis_controller.set_value('is_writing', 0)
+        self.redis_controller.set_values({'is_writing_buf': 0, 'is_recording': 0, 'is_writing': 0})
         self.gpio_output.set_recording(0) 
         
         logging.info("Stop recording timeout reached. Stopping recording...")
 
     def handle_fps_actual_change(self, data):
         # Handle "fps_actual" key changes
-        if data['key'] == 'fps_actual':
-            try:
-                fps_actual = float(data['value'])
-                if fps_actual > 0:
-                    self.stop_recording_timeout = 2
-                    #logging.info(f"fps_actual changed to {fps_actual}. Updated stop_recording_timeout to {self.stop_recording_timeout} seconds.")
-            except ValueError:
-                logging.warning("Invalid value for fps_actual. Could not update stop_recording_timeout.")
+        try:
+            fps_actual = float(data['value'])
+            if fps_actual > 0:
+                self.stop_recording_timeout = 2
+                #logging.info(f"fps_actual changed to {fps_actual}. Updated stop_recording_timeout to {self.stop_recording_timeout} seconds.")
+        except ValueError:
+            logging.warning("Invalid value for fps_actual. Could not update stop_recording_timeout.")
 
 # import logging
 # import threading
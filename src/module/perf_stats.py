@@ -0,0 +1,54 @@
+"""Rolling timing statistics for instrumenting hot loops.
+
+RollingStats keeps the last `window` samples of one measurement and reports
+p50/p95/max over them; StageTimer groups one RollingStats per named stage of
+a loop (e.g. get_values, composite, blit of a GUI frame).
+"""
+
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class RollingStats:
+    def __init__(self, window=100):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+
+    def summary(self):
+        samples = sorted(list(self.samples))
+        if not samples:
+            return {'p50': None, 'p95': None, 'max': None, 'count': self.count}
+        # nearest-rank percentiles
+        p50 = samples[(len(samples) - 1) * 50 // 100]
+        p95 = samples[(len(samples) - 1) * 95 // 100]
+        return {'p50': round(p50, 2), 'p95': round(p95, 2), 'max': round(samples[-1], 2),
+                'count': self.count}
+
+
+class StageTimer:
+    def __init__(self, window=100):
+        self.window = window
+        self.stages = {}
+
+    def add(self, stage, ms):
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = RollingStats(self.window)
+        stats.add(ms)
+
+    @contextmanager
+    def measure(self, stage):
+        """Time the body of the with statement in milliseconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, (time.perf_counter() - start) * 1000)
+
+    def summary(self):
+        return {stage: stats.summary() for stage, stats in self.stages.items()}
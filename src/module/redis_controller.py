@@ -1,8 +1,103 @@
 import redis
+import fnmatch
+import json
 import logging
+import os
 import threading
+import time
 import RPi.GPIO as GPIO
 
+from module.perf_stats import RollingStats
+
+# Errors after which the connection is retried rather than given up on
+CONNECTION_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(host='localhost', port=6379, db=0, unix_socket_path=None,
+                        max_connections=None, socket_timeout=None, health_check_interval=30):
+    """Connection pool shared by every Redis client of the process with the
+    same settings.
+
+    With unix_socket_path the pool talks to Redis over that Unix domain
+    socket, which skips the loopback TCP stack; if the socket does not
+    exist (unixsocket not enabled in redis.conf) TCP is used instead.
+    """
+    if unix_socket_path and not os.path.exists(unix_socket_path):
+        logging.warning(f"Redis socket {unix_socket_path} not found, using {host}:{port}")
+        unix_socket_path = None
+    config = (host, port, db, unix_socket_path, max_connections, socket_timeout, health_check_interval)
+    with _pools_lock:
+        pool = _pools.get(config)
+        if pool is None:
+            kwargs = dict(db=db, max_connections=max_connections, socket_timeout=socket_timeout,
+                          health_check_interval=health_check_interval)
+            if unix_socket_path:
+                pool = redis.ConnectionPool(connection_class=redis.UnixDomainSocketConnection,
+                                            path=unix_socket_path, **kwargs)
+                logging.info(f"Redis connection pool on {unix_socket_path}")
+            else:
+                pool = redis.ConnectionPool(host=host, port=port, **kwargs)
+                logging.info(f"Redis connection pool on {host}:{port}")
+            _pools[config] = pool
+        return pool
+
+
+def parse_control_message(data):
+    """Split a cp_controls message into (key, value).
+
+    Publishers may send just the key name (cinepi-raw, older code), in which
+    case value is None and the new value has to be read with GET, or carry
+    the value along as "key=value" or {"key": ..., "value": ...}.
+    """
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    if data.startswith('{'):
+        try:
+            payload = json.loads(data)
+            return str(payload['key']), str(payload['value'])
+        except (ValueError, KeyError, TypeError):
+            logging.warning(f"Malformed cp_controls payload: {data}")
+            return None, None
+    key, sep, value = data.partition('=')
+    return key, (value if sep else None)
+
+
+def _parse_int(value):
+    return int(float(value))
+
+
+def _parse_bool(value):
+    return int(float(value)) != 0
+
+
+# Known parameters and how to parse them. Values of these keys are parsed
+# once when they change and handed out by the typed getters; everything
+# else is only kept as a string.
+PARAMETER_TYPES = {
+    'iso': _parse_int,
+    'shutter_a': float,
+    'shutter_a_nom': float,
+    'fps': float,
+    'fps_actual': float,
+    'fps_max': float,
+    'height': _parse_int,
+    'width': _parse_int,
+    'sensor_mode': _parse_int,
+    'gui_layout': _parse_int,
+    'cam_init': _parse_int,
+    'is_recording': _parse_bool,
+    'is_writing': _parse_bool,
+    'is_writing_buf': _parse_bool,
+    'wb': _parse_int,
+    'auto_wb': _parse_bool,
+    'ev': float,
+    'auto_ev': _parse_bool,
+}
+
+
 class Event:
     def __init__(self):
         self._listeners = []
@@ -15,79 +110,548 @@ class Event:
         for listener in self._listeners:
             listener(data)
 
+
+class ParameterEvent(Event):
+    """Event for {'key': ..., 'value': ...} changes that listeners can
+    subscribe to by key name or glob pattern (e.g. "fps*"). Listeners
+    without keys or pattern still receive every change."""
+
+    def __init__(self):
+        super().__init__()
+        self._by_key = {}
+        self._patterns = []
+        self._pattern_matches = {}
+
+    def subscribe(self, listener, keys=None, pattern=None):
+        if keys is None and pattern is None:
+            super().subscribe(listener)
+            return
+        if isinstance(keys, str):
+            keys = (keys,)
+        for key in keys or ():
+            self._by_key.setdefault(key, []).append(listener)
+        if pattern is not None:
+            self._patterns.append((pattern, listener))
+            self._pattern_matches = {}
+
+    def listeners_for(self, key):
+        matches = self._pattern_matches.get(key)
+        if matches is None:
+            matches = [listener for pattern, listener in self._patterns
+                       if fnmatch.fnmatchcase(key, pattern)]
+            self._pattern_matches[key] = matches
+        return self._listeners + self._by_key.get(key, []) + matches
+
+    def emit(self, data=None):
+        for listener in self.listeners_for(data['key']):
+            listener(data)
+
+
+class PubSubDispatcher:
+    """One pubsub connection and one thread for all channels of the process.
+
+    Handlers are registered per channel, and on cp_controls optionally per
+    key, and are called with a dict holding the decoded message:
+    {'channel': ..., 'data': ..., 'key': ..., 'value': ...}. key and value
+    are only filled in for control channels (see parse_control_message);
+    value is None when the publisher only sent the key name.
+
+    When the connection drops, the listener thread reconnects with
+    exponential backoff, subscribes to all channels again and emits
+    the reconnected event.
+    """
+
+    def __init__(self, redis_client, channels=("cp_controls", "cp_stats"), control_channels=("cp_controls",),
+                 min_backoff=0.5, max_backoff=30.0):
+        self.redis_client = redis_client
+        self.pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        self.control_channels = set(control_channels)
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.connected = True
+        self.stopped = False
+        self.reconnects = 0
+        self.reconnected = Event()
+        self.lock = threading.Lock()
+        self._handlers = {}
+        self._key_handlers = {}
+        self.listener_thread = None
+        self.channels = set(channels)
+        if channels:
+            self.pubsub.subscribe(*channels)
+
+    def subscribe(self, channel, handler, key=None):
+        with self.lock:
+            if key is None:
+                self._handlers.setdefault(channel, []).append(handler)
+            else:
+                self._key_handlers.setdefault(channel, {}).setdefault(key, []).append(handler)
+            new_channel = channel not in self.channels
+            self.channels.add(channel)
+        if new_channel:
+            self.pubsub.subscribe(channel)
+
+    def start(self):
+        if self.listener_thread is None:
+            self.listener_thread = threading.Thread(target=self.listen)
+            self.listener_thread.daemon = True
+            self.listener_thread.start()
+
+    def listen(self):
+        backoff = self.min_backoff
+        while not self.stopped:
+            try:
+                for message in self.pubsub.listen():
+                    if message["type"] == "message":
+                        self.dispatch(message["channel"].decode('utf-8'), message["data"].decode('utf-8'))
+                # listen() only returns once everything is unsubscribed
+                break
+            except CONNECTION_ERRORS as e:
+                if self.stopped:
+                    break
+                self.connected = False
+                logging.warning(f"Redis pubsub connection lost: {e}, reconnecting in {backoff:.1f} s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                if self.resubscribe():
+                    backoff = self.min_backoff
+
+    def resubscribe(self):
+        try:
+            self.pubsub.close()
+        except Exception:
+            pass
+        pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            with self.lock:
+                channels = list(self.channels)
+            pubsub.subscribe(*channels)
+        except CONNECTION_ERRORS as e:
+            logging.warning(f"Redis still unavailable: {e}")
+            return False
+        self.pubsub = pubsub
+        self.connected = True
+        self.reconnects += 1
+        logging.info(f"Redis pubsub reconnected, subscribed to {', '.join(sorted(channels))}")
+        self.reconnected.emit()
+        return True
+
+    def dispatch(self, channel, data):
+        key = value = None
+        if channel in self.control_channels:
+            key, value = parse_control_message(data)
+        with self.lock:
+            handlers = list(self._handlers.get(channel, ()))
+            if key is not None:
+                handlers += self._key_handlers.get(channel, {}).get(key, ())
+        message = {'channel': channel, 'data': data, 'key': key, 'value': value}
+        for handler in handlers:
+            try:
+                handler(message)
+            except Exception as e:
+                logging.error(f"Error in {channel} handler {handler}: {e}")
+
+    def stop(self):
+        self.stopped = True
+        self.pubsub.unsubscribe()
+        self.pubsub.close()
+        if self.listener_thread is not None:
+            self.listener_thread.join()
+
+
 class RedisController:
+    # Keys that are always written synchronously, after any queued writes
+    CRITICAL_KEYS = {'is_recording', 'cam_init'}
 
-    def __init__(self, host='localhost', port=6379, db=0, channel_name="cp_controls"):
-        self.redis_client = redis.StrictRedis(host=host, port=port, db=db)
-        self.pubsub = self.redis_client.pubsub()
+    def __init__(self, host='localhost', port=6379, db=0, channel_name="cp_controls", publish_values=False,
+                 warmup_keys=None, warmup_patterns=(), write_behind=False, critical_keys=None,
+                 health_interval=5.0, unix_socket_path=None, max_connections=None, socket_timeout=None):
+        self.connection_pool = get_connection_pool(host, port, db, unix_socket_path=unix_socket_path,
+                                                   max_connections=max_connections,
+                                                   socket_timeout=socket_timeout)
+        self.redis_client = redis.StrictRedis(connection_pool=self.connection_pool)
         self.channel_name = channel_name
+
+        # Shared pubsub connection, other modules register their channel
+        # handlers here instead of opening their own
+        self.dispatcher = PubSubDispatcher(self.redis_client, channels=(channel_name, "cp_stats"),
+                                           control_channels=(channel_name,))
+
+        # Announce changes as "key=value" so listeners can skip the GET.
+        # Off by default: cinepi-raw expects the bare key name.
+        self.publish_values = publish_values
         
+        # self.lock only guards swapping in a new cache snapshot, write_lock
+        # keeps the SET+PUBLISH of concurrent writers in order. Readers take
+        # neither, so they never wait for Redis.
         self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
         
-        self.redis_parameter_changed = Event()
+        self.redis_parameter_changed = ParameterEvent()
+
+        # Write-behind: set_value only updates the cache and queues the
+        # write; a flusher thread sends the queue in pipelines, keeping the
+        # last value per key. Critical keys flush the queue and go out
+        # synchronously.
+        self.write_behind = write_behind
+        self.critical_keys = set(self.CRITICAL_KEYS if critical_keys is None else critical_keys)
+        self.pending_writes = {}
+        self.inflight_writes = {}
+        self.pending_condition = threading.Condition()
+
+        # Connection health: writes that fail because Redis is unreachable
+        # are queued and retried by the flusher instead of raising in the
+        # caller's thread
+        self.connected = True
+        self.errors = 0
+        self.last_error = None
+        self.latency = RollingStats()
+        self.health_interval = health_interval
+
+        self.flusher_thread = threading.Thread(target=self.flush_loop)
+        self.flusher_thread.daemon = True
+        self.flusher_thread.start()
         
-        # Cache to store the values
+        # Cache to store the values: a copy-on-write snapshot of
+        # key -> (string as Redis returns it, parsed value or None), parsed
+        # for the keys in PARAMETER_TYPES. It is replaced, never modified.
         self.cache = {}
 
+        # Keys loaded at startup: the known parameters (or warmup_keys) plus
+        # whatever matches warmup_patterns, e.g. "cp_*"
+        self.warmup_keys = list(PARAMETER_TYPES) if warmup_keys is None else list(warmup_keys)
+        self.warmup_patterns = list(warmup_patterns)
+
         # Subscribe to the channel
-        self.pubsub.subscribe(channel_name)
+        self.dispatcher.subscribe(channel_name, self.handle_control_message)
+        self.dispatcher.reconnected.subscribe(self.handle_reconnect)
 
         # Initialize the cache with initial values
         self.init_cache()
         
         # Start the listener thread
-        self.listener_thread = threading.Thread(target=self.listen)
-        self.listener_thread.daemon = True  # This makes sure the thread will exit when the main program exits
-        self.listener_thread.start()
+        self.dispatcher.start()
+
+        if health_interval:
+            self.health_thread = threading.Thread(target=self.health_loop)
+            self.health_thread.daemon = True
+            self.health_thread.start()
     
 
     def init_cache(self):
-        with self.lock:
-            logging.info("Initializing cache with Redis values...")
-            all_keys = self.redis_client.keys('*')
-            for key in all_keys:
-                value = self.redis_client.get(key)
+        """Load the warmup keys with one MGET.
+
+        Patterns are expanded with SCAN, which unlike KEYS * does not block
+        a Redis server shared with cinepi-raw.
+        """
+        logging.info("Initializing cache with Redis values...")
+        start = time.perf_counter()
+        keys = list(self.warmup_keys)
+        for pattern in self.warmup_patterns:
+            for key in self.redis_client.scan_iter(match=pattern, count=100):
                 key_str = key.decode('utf-8')
-                value_str = value.decode('utf-8')
-                self.cache[key_str] = value_str
-                logging.info(f"Cached: {key_str} = {value_str}")
+                if key_str not in keys:
+                    keys.append(key_str)
 
-    def listen(self):
+        values = self.redis_client.mget(keys) if keys else []
+        items = []
+        for key_str, value in zip(keys, values):
+            if value is None:
+                continue
+            value_str = value.decode('utf-8')
+            items.append((key_str, value_str))
+            logging.debug(f"Cached: {key_str} = {value_str}")
+        self._store(items)
+        logging.info(f"Cached {len(items)} of {len(keys)} keys in {(time.perf_counter() - start) * 1000:.1f} ms")
 
-        for message in self.pubsub.listen():
-            if message["type"] == "message":
-                changed_key = message["data"].decode('utf-8')
-                with self.lock:
-                    value = self.redis_client.get(changed_key)
-                    value_str = value.decode('utf-8')
-                    # Update cache with new value
-                    self.cache[changed_key] = value_str
-                logging.info(f"Changed value: {changed_key} = {value_str}")
-                self.redis_parameter_changed.emit({'key': changed_key, 'value': value_str})
+    def handle_control_message(self, message):
+        changed_key, value_str = message['key'], message['value']
+        if changed_key is None or self.has_pending_write(changed_key):
+            # a newer local value is on its way to Redis
+            return
+        if value_str is None:
+            # Key-only notification, read the value outside the lock
+            value = self.redis_client.get(changed_key)
+            if value is None:
+                logging.warning(f"Changed key {changed_key} has no value")
+                return
+            value_str = value.decode('utf-8')
+        # Update cache with new value
+        self._store(((changed_key, value_str),))
+        logging.info(f"Changed value: {changed_key} = {value_str}")
+        self.redis_parameter_changed.emit({'key': changed_key, 'value': value_str})
 
-    def get_value(self, key, default=None):
+    def resync(self):
+        """Reload all known keys with one MGET and announce the ones that
+        changed while the pubsub connection was down."""
+        keys = list(dict.fromkeys(self.warmup_keys + list(self.cache)))
+        values = self.redis_client.mget(keys) if keys else []
+        changed = []
+        for key, value in zip(keys, values):
+            if value is None or self.has_pending_write(key):
+                continue
+            value_str = value.decode('utf-8')
+            entry = self.cache.get(key)
+            if entry is None or entry[0] != value_str:
+                changed.append((key, value_str))
+        self._store(changed)
+        logging.info(f"Resynced cache, {len(changed)} of {len(keys)} keys changed")
+        for key, value_str in changed:
+            self.redis_parameter_changed.emit({'key': key, 'value': value_str})
+
+    def handle_reconnect(self, data=None):
+        try:
+            self.resync()
+        except CONNECTION_ERRORS as e:
+            self.record_error(e)
+        # retry queued writes right away
+        with self.pending_condition:
+            self.pending_condition.notify()
+
+    def record_error(self, error):
+        self.connected = False
+        self.errors += 1
+        self.last_error = str(error)
+
+    def ping(self):
+        """Round trip to Redis, recorded in the latency statistics"""
+        start = time.perf_counter()
+        self.redis_client.ping()
+        self.latency.add((time.perf_counter() - start) * 1000)
+        self.connected = True
+
+    def health(self):
+        return {
+            'connected': self.connected and self.dispatcher.connected,
+            'reconnects': self.dispatcher.reconnects,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'pending_writes': len(self.pending_writes),
+            'latency_ms': self.latency.summary(),
+        }
+
+    def health_loop(self):
+        while not self.dispatcher.stopped:
+            time.sleep(self.health_interval)
+            try:
+                self.ping()
+                self.set_stat('redis_health', json.dumps(self.health()))
+            except CONNECTION_ERRORS as e:
+                self.record_error(e)
+                logging.warning(f"Redis health check failed: {e}")
+            except redis.RedisError as e:
+                # e.g. a rejected command, keep monitoring
+                logging.error(f"Error in Redis health check: {e}")
+
+    def control_message(self, key, value):
+        return f"{key}={value}" if self.publish_values else key
+
+    def _store(self, items):
+        """Swap in a new cache snapshot with the (key, value) items applied.
+        Values are cached as strings and, if the key is known, parsed."""
+        entries = []
+        for key, value in items:
+            value_str = value if isinstance(value, str) else str(value)
+            parsed = None
+            parse = PARAMETER_TYPES.get(key)
+            if parse is not None:
+                try:
+                    parsed = parse(value_str)
+                except ValueError:
+                    pass
+            entries.append((key, (value_str, parsed)))
         with self.lock:
-            return self.cache.get(key, default)
+            cache = dict(self.cache)
+            cache.update(entries)
+            self.cache = cache
+
+    def get_value(self, key, default=None):
+        entry = self.cache.get(key)
+        return default if entry is None else entry[0]
+
+    def _get_as(self, key, kind, parse, default):
+        entry = self.cache.get(key)
+        if entry is None:
+            return default
+        value = entry[0] if entry[1] is None else entry[1]
+        if type(value) is kind:
+            return value
+        return parse(value)
+
+    def get_int(self, key, default=None):
+        return self._get_as(key, int, _parse_int, default)
+
+    def get_float(self, key, default=None):
+        return self._get_as(key, float, float, default)
+
+    def get_bool(self, key, default=None):
+        return self._get_as(key, bool, _parse_bool, default)
+
+    def get_typed(self, key, default=None):
+        """Value parsed according to PARAMETER_TYPES (string for other keys)"""
+        entry = self.cache.get(key)
+        if entry is None:
+            return default
+        return entry[0] if entry[1] is None else entry[1]
+
+    def has_pending_write(self, key):
+        with self.pending_condition:
+            return key in self.pending_writes or key in self.inflight_writes
+
+    def queue_writes(self, mapping):
+        """Cache and queue the values, and announce the ones that changed
+        right away. The cp_controls notification of a queued write is
+        ignored while the write is pending or in flight, so it cannot be
+        relied on for the event."""
+        changed = []
+        for key, value in mapping.items():
+            value_str = value if isinstance(value, str) else str(value)
+            entry = self.cache.get(key)
+            if entry is None or entry[0] != value_str:
+                changed.append((key, value_str))
+        self._store(mapping.items())
+        with self.pending_condition:
+            self.pending_writes.update(mapping)
+            self.pending_condition.notify()
+        for key, value_str in changed:
+            self.redis_parameter_changed.emit({'key': key, 'value': value_str})
+
+    def _send(self, mapping, transaction=False):
+        """SET all keys, then PUBLISH them, in one pipeline. Caller holds write_lock."""
+        start = time.perf_counter()
+        pipe = self.redis_client.pipeline(transaction=transaction)
+        for key, value in mapping.items():
+            pipe.set(key, value)
+        for key, value in mapping.items():
+            pipe.publish('cp_controls', self.control_message(key, value))
+        pipe.execute()
+        self.latency.add((time.perf_counter() - start) * 1000)
+        self.connected = True
+
+    def _flush_pending(self):
+        """Write out the queued values. Caller holds write_lock."""
+        with self.pending_condition:
+            batch, self.pending_writes = self.pending_writes, {}
+            self.inflight_writes = batch
+        if not batch:
+            return
+        try:
+            self._send(batch)
+        except CONNECTION_ERRORS:
+            with self.pending_condition:
+                # put the batch back unless a newer value was queued meanwhile
+                for key, value in batch.items():
+                    self.pending_writes.setdefault(key, value)
+            raise
+        finally:
+            with self.pending_condition:
+                self.inflight_writes = {}
+
+    def flush(self):
+        """Block until every queued write has been sent to Redis"""
+        with self.write_lock:
+            self._flush_pending()
+
+    def flush_loop(self):
+        backoff = self.dispatcher.min_backoff
+        while True:
+            with self.pending_condition:
+                while not self.pending_writes:
+                    self.pending_condition.wait()
+            try:
+                self.flush()
+                backoff = self.dispatcher.min_backoff
+            except redis.RedisError as e:
+                if not isinstance(e, CONNECTION_ERRORS):
+                    # the batch was rejected and is not retried
+                    logging.error(f"Error flushing queued Redis writes: {e}")
+                    continue
+                self.record_error(e)
+                logging.error(f"Error flushing queued Redis writes, retrying in {backoff:.1f} s: {e}")
+                with self.pending_condition:
+                    # a reconnect notifies and cuts the wait short
+                    self.pending_condition.wait(backoff)
+                backoff = min(backoff * 2, self.dispatcher.max_backoff)
 
     def set_value(self, key, value):
-        with self.lock:
-            #cap fps
-            # if key == 'fps':
-            #     if int(self.get_value('height')) == 1080 and value < 50:
-            #         value = 50
-            #     if int(self.get_value('height')) == 1520 and value < 40:
-            #         value = 40
-                
-            self.redis_client.set(key, value)
-            # Notify about the key change via the cp_controls channel
-            self.redis_client.publish('cp_controls', key)
-            # Update cache immediately
-            self.cache[key] = value
+        """Returns False if a critical key could not be written, it is then
+        neither cached nor queued."""
+        if self.write_behind and key not in self.critical_keys:
+            self.queue_writes({key: value})
+            return True
+        try:
+            with self.write_lock:
+                self._flush_pending()
+                #cap fps
+                # if key == 'fps':
+                #     if int(self.get_value('height')) == 1080 and value < 50:
+                #         value = 50
+                #     if int(self.get_value('height')) == 1520 and value < 40:
+                #         value = 40
+
+                start = time.perf_counter()
+                self.redis_client.set(key, value)
+                # Notify about the key change via the cp_controls channel
+                self.redis_client.publish('cp_controls', self.control_message(key, value))
+                self.latency.add((time.perf_counter() - start) * 1000)
+                self.connected = True
+                # Update cache immediately
+                self._store(((key, value),))
+        except CONNECTION_ERRORS as e:
+            self.record_error(e)
+            if key in self.critical_keys:
+                # never applied speculatively, cinepi-raw did not get it
+                logging.error(f"Could not write {key} to Redis: {e}")
+                return False
+            logging.error(f"Could not write {key} to Redis, retrying in the background: {e}")
+            self.queue_writes({key: value})
+        return True
+
+    def set_values(self, mapping, transaction=False):
+        """Set several keys in one round trip.
+
+        All SETs are sent before the PUBLISHes, in mapping order, so a
+        subscriber reacting to the first notification already finds every
+        new value. With transaction=True the whole batch runs as one
+        MULTI/EXEC and no other client sees it half applied.
+
+        In write-behind mode a batch without critical keys is queued like
+        set_value does; otherwise queued writes are flushed first.
+
+        Returns False if Redis could not be reached and the batch holds a
+        critical key, in which case nothing is applied or queued.
+        """
+        if not mapping:
+            return True
+        if self.write_behind and not transaction and self.critical_keys.isdisjoint(mapping):
+            self.queue_writes(mapping)
+            return True
+        try:
+            with self.write_lock:
+                self._flush_pending()
+                self._send(mapping, transaction)
+                # Update cache immediately
+                self._store(mapping.items())
+        except CONNECTION_ERRORS as e:
+            self.record_error(e)
+            if not self.critical_keys.isdisjoint(mapping):
+                logging.error(f"Could not write {', '.join(mapping)} to Redis: {e}")
+                return False
+            logging.error(f"Could not write {', '.join(mapping)} to Redis, retrying in the background: {e}")
+            self.queue_writes(dict(mapping))
+        return True
+
+    def set_stat(self, key, value):
+        """Store a statistics value without announcing it on cp_controls"""
+        self.redis_client.set(key, value)
+
+    def increment_stat(self, key, amount=1):
+        """Add to a statistics counter without announcing it on cp_controls,
+        returns the new count"""
+        return self.redis_client.incrby(key, amount)
 
     def stop_listener(self):
-        with self.lock:
-            # Unsubscribe and close the pubsub connection
-            self.pubsub.unsubscribe()
-            self.pubsub.close()
-            # Here, we're not putting the join() inside the lock to avoid potential deadlocks
-        self.listener_thread.join()
\ No newline at end of file
+        # Send queued writes, then unsubscribe, close the pubsub connection
+        # and wait for the thread
+        self.flush()
+        self.dispatcher.stop()
\ No newline at end of file
@@ -1,116 +1,266 @@
-import redis
+import json
 import logging
+import os
 import threading
 import time
-import statistics
 import datetime
 
+from module.frame_stats import FrameLog, FramerateStats, GapTracker, Histogram, analyze_frame_log
+
+class Event:
+    def __init__(self):
+        self._listeners = []
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def emit(self, *args):
+        for listener in self._listeners:
+            try:
+                listener(*args)
+            except Exception as e:
+                logging.error(f"Error while invoking listener: {e}")
+
 class RedisListener:
-    def __init__(self, redis_controller, host='localhost', port=6379, db=0):
-        self.redis_client = redis.StrictRedis(host=host, port=port, db=db)
-        
-        self.pubsub_stats = self.redis_client.pubsub()
-        self.pubsub_controls = self.redis_client.pubsub()
+    def __init__(self, redis_controller, ssd_monitor=None, drop_tolerance=0.5, drop_settle_frames=3):
+        # cp_stats arrives through the controller's shared pubsub
+        # dispatcher and is_recording changes through its parameter event,
+        # no connection or thread of our own
+        self.dispatcher = redis_controller.dispatcher
         self.channel_name_stats = "cp_stats"
-        self.channel_name_controls = "cp_controls"
 
         self.stdev_threshold = 2.0
         self.lock = threading.Lock()
         self.is_recording = False
-        self.framerate_values = []  # Initialize the framerate_values attribute
-        
         self.recording_start_time = None
         self.recording_end_time = None
         
         self.redis_controller = redis_controller
+        # Used to find the take folder for the frame report sidecar
+        self.ssd_monitor = ssd_monitor
+        self.drop_tolerance = drop_tolerance
+        # Frames after an fps change that may still come at the old rate
+        self.drop_settle_frames = drop_settle_frames
+        self.last_report = None
+        self.analysis = None
+
+        # Dropped frames are detected live from the frame intervals: an
+        # interval longer than (1 + drop_tolerance) nominal intervals counts
+        # as a drop. Each detection increments frames_dropped in Redis and
+        # emits frame_drop_event with the number of frames lost.
+        self.frame_drop_event = Event()
+        self.last_drop_time = None
         
-        self.framerate = float(self.redis_controller.get_value('fps_actual'))
+        self.framerate = self.redis_controller.get_float('fps_actual')
+
+        # Streaming statistics of the current take, constant memory, plus
+        # every frame in a FrameLog for the detailed analysis when
+        # recording stops
+        self.reset_take()
         
         self.start_listeners()
 
     def start_listeners(self):
-        # Subscribe to the channels
-        self.pubsub_stats.subscribe(self.channel_name_stats)
-        self.pubsub_controls.subscribe(self.channel_name_controls)
-
-        # Start the listener threads
-        self.listener_thread_stats = threading.Thread(target=self.listen_stats)
-        self.listener_thread_stats.daemon = True
-        self.listener_thread_stats.start()
-
-        self.listener_thread_controls = threading.Thread(target=self.listen_controls)
-        self.listener_thread_controls.daemon = True
-        self.listener_thread_controls.start()
-
-    def listen_stats(self):
-
-            for message in self.pubsub_stats.listen():
-                if message['type'] == 'message':
-                    message_data = message['data'].decode('utf-8')
-                    if message_data.startswith("framerate:"):
-                        framerate_str = message_data.split("framerate:")[1]
-                        try:
-                            framerate_value = float(framerate_str)
-                            with self.lock:
-                                if self.is_recording == True:
-                                    self.framerate_values.append(framerate_value)
-                                    #logging.info(f"Registered framerate value: {framerate_value}")
-                        except ValueError as e:
-                            logging.error(f"Failed to convert framerate value to float: {e}")
-
-    def listen_controls(self):
-        for message in self.pubsub_controls.listen():
-            if message["type"] == "message":
-                changed_key = message["data"].decode('utf-8')
+        self.dispatcher.subscribe(self.channel_name_stats, self.listen_stats)
+        self.redis_controller.redis_parameter_changed.subscribe(self.listen_controls, keys='is_recording')
+        self.redis_controller.redis_parameter_changed.subscribe(self.listen_fps, keys='fps_actual')
+
+    def reset_take(self):
+        self.framerate_stats = FramerateStats()
+        self.frame_log = FrameLog()
+        self.histogram = Histogram()
+        self.gap_tracker = GapTracker(1000 / self.framerate if self.framerate else 0,
+                                      tolerance=self.drop_tolerance)
+
+    def listen_stats(self, message):
+        message_data = message['data']
+        if message_data.startswith("framerate:"):
+            framerate_str = message_data.split("framerate:")[1]
+            try:
+                framerate_value = float(framerate_str)
                 with self.lock:
-                    value = self.redis_client.get(changed_key)
-                    value_str = value.decode('utf-8')
-
-                    if changed_key == 'is_recording':
-                        if value_str == '1':
-                            self.is_recording = True
-                            self.recording_start_time = datetime.datetime.now()
-                            logging.info(f"Recording started at: {self.recording_start_time}")
-                            self.framerate = float(self.redis_controller.get_value('fps_actual'))
-                        elif value_str == '0':
-                            self.is_recording = False
-                            if self.recording_start_time:
-                                self.recording_end_time = datetime.datetime.now()
-                                logging.info(f"Recording stopped at: {self.recording_end_time}")
-                                self.analyze_frames()
-                                self.framerate_values = []
-                            else:
-                                logging.warning("Recording stopped, but no recording start time was registered.")
+                    dropped = 0
+                    if self.is_recording == True:
+                        self.framerate_stats.add(framerate_value)
+                        self.frame_log.add(time.monotonic(), framerate_value,
+                                           self.gap_tracker.reference_interval, self.gap_tracker.settling)
+                        self.histogram.add(framerate_value)
+                        if framerate_value > 0:
+                            dropped = self.gap_tracker.add(1000 / framerate_value)
+                        #logging.info(f"Registered framerate value: {framerate_value}")
+                if dropped:
+                    self.report_drop(dropped)
+            except ValueError as e:
+                logging.error(f"Failed to convert framerate value to float: {e}")
+
+    def listen_fps(self, data):
+        # fps can change during a take (fps button, ramps), frames are
+        # judged against the current rate
+        try:
+            fps = float(data['value'])
+        except (TypeError, ValueError):
+            return
+        with self.lock:
+            if self.is_recording and fps > 0:
+                self.gap_tracker.set_nominal_interval(1000 / fps, self.drop_settle_frames)
+
+    @property
+    def frames_dropped(self):
+        """Frames dropped in the current (or last) take"""
+        return self.gap_tracker.dropped
+
+    def report_drop(self, dropped):
+        self.last_drop_time = time.monotonic()
+        logging.warning(f"Dropped {dropped} frame(s) at frame {self.gap_tracker.frames - 1}, "
+                        f"{self.gap_tracker.dropped} this take")
+        try:
+            self.redis_controller.increment_stat('frames_dropped', dropped)
+        except Exception as e:
+            logging.warning(f"Could not update frames_dropped: {e}")
+        self.frame_drop_event.emit(dropped)
+
+    def listen_controls(self, data):
+        changed_key, value_str = data['key'], data['value']
+        with self.lock:
+            if changed_key == 'is_recording':
+                if value_str == '1':
+                    self.is_recording = True
+                    self.recording_start_time = datetime.datetime.now()
+                    logging.info(f"Recording started at: {self.recording_start_time}")
+                    self.framerate = self.redis_controller.get_float('fps_actual')
+                    self.reset_take()
+                    watcher = self.ssd_monitor.directory_watcher if self.ssd_monitor else None
+                    if watcher:
+                        watcher.start_take()
+                    self.last_drop_time = None
+                    try:
+                        self.redis_controller.set_stat('frames_dropped', 0)
+                    except Exception as e:
+                        logging.warning(f"Could not reset frames_dropped: {e}")
+                    # clears the GUI's drop indicator
+                    self.frame_drop_event.emit(0)
+                elif value_str == '0':
+                    # is_recording=0 is published again by the stop timeout
+                    # and on SSD unmount, only the first one ends the take
+                    if not self.is_recording:
+                        return
+                    self.is_recording = False
+                    if self.recording_start_time:
+                        self.recording_end_time = datetime.datetime.now()
+                        logging.info(f"Recording stopped at: {self.recording_end_time}")
+                        self.analyze_frames()
+                        self.recording_start_time = None
+                    else:
+                        logging.warning("Recording stopped, but no recording start time was registered.")
 
     def analyze_frames(self):
+        # Called under self.lock on the pubsub thread, only the constant
+        # time summary is done here
+        expected_frames = None
         if self.recording_start_time and self.recording_end_time:
             time_diff_seconds = (self.recording_end_time - self.recording_start_time).total_seconds()
             expected_frames = int(self.framerate * time_diff_seconds)
         else:
             logging.warning("Cannot calculate expected frames: Recording start or end time not registered.")
         
-        num_frames = len(self.framerate_values)
+        stats = self.framerate_stats.summary()
+        num_frames = stats['count']
         
         if num_frames > 0:
-            average_framerate = sum(self.framerate_values) / len(self.framerate_values)
-            min_framerate = min(self.framerate_values)
-            max_framerate = max(self.framerate_values)
-            median_framerate = statistics.median(self.framerate_values)
-            stdev_framerate = statistics.stdev(self.framerate_values)
-            variance_framerate = statistics.variance(self.framerate_values)
-            cv_framerate = stdev_framerate / average_framerate
+            average_framerate = stats['mean']
+            min_framerate = stats['min']
+            max_framerate = stats['max']
+            median_framerate = stats['median']
+            stdev_framerate = stats['stdev']
+            variance_framerate = stats['variance']
+            cv_framerate = stats['cv']
             
             logging.info(f"Total number of frames registered: {num_frames}")
             logging.info(f"Total number of frames expected: {expected_frames}")
+            logging.info(f"Dropped frames detected: {self.gap_tracker.dropped}")
             
             logging.info(f"Average framerate value: {average_framerate}")
             logging.info(f"Minimum framerate value: {min_framerate}")
             logging.info(f"Maximum framerate value: {max_framerate}")
             logging.info(f"Median framerate value: {median_framerate}")
+            logging.info(f"99th percentile framerate value: {stats['p99']}")
             logging.info(f"Standard deviation of framerate values: {stdev_framerate}")
             logging.info(f"Variance of framerate values: {variance_framerate}")
             logging.info(f"Coefficient of variation of framerate values: {cv_framerate}")
         else:
             logging.warning("No framerate values recorded.")
 
+        folder = None
+        watcher = self.ssd_monitor.directory_watcher if self.ssd_monitor else None
+        if watcher:
+            folder = watcher.current_take_folder()
+
+        # Snapshot of the take. The FrameLog is no longer written once
+        # recording stopped and the next take gets a new one, so it is
+        # handed over as is.
+        take = {
+            'start': self.recording_start_time,
+            'end': self.recording_end_time,
+            'fps': self.framerate,
+            'frames_expected': expected_frames,
+            'stats': stats,
+            'gaps': self.gap_tracker.summary(),
+            'histogram': self.histogram.summary(),
+            'frame_log': self.frame_log,
+            'folder': folder,
+        }
+        threading.Thread(target=self.report_take, args=(take,), daemon=True).start()
+
+    def report_take(self, take):
+        """Analyze the take's FrameLog, publish the frame timing report and
+        write it next to the clip as <take>_frames.json. Runs on its own
+        thread so a long take does not hold up the pubsub dispatcher."""
+        analysis = analyze_frame_log(take['frame_log'], tolerance=self.drop_tolerance) or {}
+        self.analysis = analysis
+        if analysis.get('jitter'):
+            logging.info(f"Frame interval jitter: {analysis['jitter']['stdev_ms']} ms, "
+                         f"{len(analysis['drop_runs'])} drop runs")
+
+        stats = take['stats']
+        gaps = take['gaps']
+        folder = take['folder']
+        report = {
+            'take': os.path.basename(folder) if folder else None,
+            'start': take['start'].isoformat() if take['start'] else None,
+            'end': take['end'].isoformat() if take['end'] else None,
+            'fps': take['fps'],
+            'frames_expected': take['frames_expected'],
+            'frames_registered': stats['count'],
+            'frames_dropped': gaps['dropped'],
+            'drop_positions': gaps['positions'],
+            'drop_positions_truncated': gaps['positions_truncated'],
+            'worst_gaps': gaps['worst_gaps'],
+            'framerate': {name: stats[name] for name in ('mean', 'min', 'max', 'median', 'p99', 'stdev', 'cv')},
+            'percentiles': analysis.get('percentiles'),
+            'jitter': analysis.get('jitter'),
+            'arrival_jitter_ms': analysis.get('arrival_jitter_ms'),
+            'drop_runs': analysis.get('drop_runs', []),
+            'drop_runs_truncated': analysis.get('drop_runs_truncated', False),
+            'rolling_mean': analysis.get('rolling_mean', []),
+            'histogram': take['histogram'],
+        }
+        self.last_report = report
+
+        try:
+            self.redis_controller.set_stat('take_report', json.dumps(report))
+        except Exception as e:
+            logging.warning(f"Could not publish take report: {e}")
+
+        if folder:
+            self.write_report(folder, report)
+        else:
+            logging.warning("No frames of this take found on disk, frame report not written")
 
+    def write_report(self, folder, report):
+        path = os.path.join(folder, f"{os.path.basename(folder)}_frames.json")
+        try:
+            with open(path, 'w') as file:
+                json.dump(report, file, indent=1)
+            logging.info(f"Frame report written to {path}")
+        except OSError as e:
+            logging.error(f"Could not write frame report {path}: {e}")
@@ -5,6 +5,20 @@ import logging
 import queue
 import serial
 
+class Event:
+    def __init__(self):
+        self._listeners = []
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def emit(self, *args):
+        for listener in self._listeners:
+            try:
+                listener(*args)
+            except Exception as e:
+                logging.error(f"Error while invoking listener: {e}")
+
 class SerialHandler(threading.Thread):
     def __init__(self, callback, baudrate=9600, timeout=1, log_queue=None):
         threading.Thread.__init__(self)
@@ -18,6 +32,9 @@ class SerialHandler(threading.Thread):
         self.portlist = ['/dev/ttyACM0']#, '/dev/serial0', '/dev/ttyS0']
          
         self.current_ports = []
+        
+        # Emitted with the new list of open ports whenever it changes
+        self.ports_changed_event = Event()
 
         # Start with checking available poarts during the creation of the object 
         self.update_available_ports()
@@ -96,6 +113,8 @@ class SerialHandler(threading.Thread):
         return responses
 
     def update_available_ports(self):
+        previous_ports = self.current_ports
+
         # Close ports that are no longer available
         for ser in self.serials:
             if ser.port not in self.portlist:
@@ -118,6 +137,9 @@ class SerialHandler(threading.Thread):
                     logging.info(f"current ports {self.current_ports}")
                 except serial.SerialException as e:
                     continue
+
+        if self.current_ports != previous_ports:
+            self.ports_changed_event.emit(self.current_ports)
  
     def run(self):
         while self.running:
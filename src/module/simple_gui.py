@@ -1,16 +1,95 @@
 import os
 import time
 import threading
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 import psutil   
 import subprocess
 from gpiozero import CPUTemperature
 from module.framebuffer import Framebuffer  # pytorinox
+from module.gui_compositor import Compositor, Widget, get_font
+from module.perf_stats import StageTimer
 import traceback
 import logging
+import json
+
+# Fixed position, font size and label of every HUD widget per gui_layout.
+# Widgets without a label show a value supplied at draw time.
+GUI_LAYOUTS = {
+    0: {
+        'iso': ((10, -7), 34, None),
+        'shutter_a': ((110, -7), 34, None),
+        'fps': ((205, -7), 34, None),
+        'fps_sw': ((1090, -2), 26, 'FPS SW'),
+        'exposure': ((1210, -7), 34, None),
+        'pwm': ((1323, -2), 26, 'PWM'),
+        'sync': ((1425, -2), 26, 'SYNC   /'),
+        'shutter_a_nom': ((1525, -2), 26, None),
+        'lock': ((1610, -2), 26, 'LOCK'),
+        'volt': ((1700, -2), 26, 'VOLT'),
+        'cpu_load': ((1790, -2), 26, None),
+        'cpu_temp': ((1875, -2), 26, None),
+        'min_left': ((10, 1044), 34, None),
+        'mic': ((160, 1050), 26, 'MIC'),
+        'key': ((225, 1050), 26, 'KEY'),
+        'ser': ((290, 1050), 26, 'SER'),
+        'drop': ((360, 1050), 26, None),
+        'wav': ((1445, 1050), 26, ' |   WAV'),
+    },
+    1: {
+        'iso': ((0, -7), 51, None),
+        'shutter_a': ((10, 80), 51, None),
+        'fps': ((10, 167), 51, None),
+        'fps_sw': ((10, 260), 34, 'FPS SW'),
+        'exposure': ((10, 340), 51, None),
+        'pwm': ((10, 427), 34, 'PWM'),
+        'sync': ((10, 495), 34, 'SYNC'),
+        'shutter_a_nom': ((10, 540), 34, None),
+        'lock': ((10, 610), 34, 'LOCK'),
+        'volt': ((10, 680), 34, 'VOLTAGE'),
+        'drop': ((10, 750), 34, None),
+        'cpu_load': ((1740, -7), 34, None),
+        'cpu_temp': ((1860, -7), 34, None),
+        'min_left': ((10, 1044), 34, None),
+        'mic': ((10, 910), 26, 'MIC'),
+        'key': ((10, 950), 26, 'KEY'),
+        'ser': ((10, 990), 26, 'SER'),
+    },
+    2: {
+        'iso': ((-3, -7), 34, None),
+        'shutter_a': ((-3, 80), 34, None),
+        'fps': ((-3, 167), 34, None),
+        'fps_sw': ((-3, 260), 34, 'FPS SW'),
+        'exposure': ((-3, 340), 34, None),
+        'pwm': ((-3, 427), 28, 'PWM'),
+        'sync': ((-3, 495), 28, 'SYNC'),
+        'shutter_a_nom': ((-3, 540), 34, None),
+        'lock': ((-3, 610), 28, 'LOCK'),
+        'volt': ((-3, 680), 34, 'VOLTAGE'),
+        'drop': ((-3, 750), 28, None),
+        'cpu_load': ((1862, -7), 26, None),
+        'cpu_temp': ((1862, 21), 26, None),
+        'min_left': ((-3, 1044), 26, None),
+        'mic': ((-3, 910), 26, 'MIC'),
+        'key': ((-3, 950), 26, 'KEY'),
+        'ser': ((-3, 990), 26, 'SER'),
+    },
+}
 
 class SimpleGUI(threading.Thread):
-    def __init__(self, pwm_controller, redis_controller, cinepi_controller, usb_monitor, ssd_monitor, serial_handler, dmesg_monitor
+    # Redis keys that change something on screen
+    REDRAW_KEYS = {'iso', 'shutter_a', 'shutter_a_nom', 'fps', 'fps_actual',
+                   'is_recording', 'is_writing_buf', 'gui_layout', 'sensor_mode'}
+
+    def __init__(self, pwm_controller, redis_controller, cinepi_controller, usb_monitor, ssd_monitor, serial_handler, dmesg_monitor,
+                 event_driven=False,
+                 coalesce_interval=0.05,
+                 heartbeat_interval=1.0,
+                 perf_overlay=False,
+                 stats_interval=1.0,
+                 double_buffer=False,
+                 fb=None,
+                 autostart=True,
+                 redis_listener=None
                  ):
         threading.Thread.__init__(self)
 
@@ -21,7 +100,26 @@ class SimpleGUI(threading.Thread):
         self.ssd_monitor = ssd_monitor
         self.serial_handler = serial_handler
         self.dmesg_monitor = dmesg_monitor
+        # Optional, shows DROP with the take's dropped frame count
+        self.redis_listener = redis_listener
         
+        # In event-driven mode the GUI only redraws when one of the monitors
+        # reports a change, after waiting coalesce_interval for related
+        # changes to arrive. CPU load/temperature and minutes left are
+        # refreshed every heartbeat_interval.
+        self.event_driven = event_driven
+        self.coalesce_interval = coalesce_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.redraw_event = threading.Event()
+
+        # Per-stage frame timings, published to Redis under gui_stats every
+        # stats_interval seconds and optionally drawn in a corner
+        self.perf = StageTimer()
+        self.perf_overlay = perf_overlay
+        self.stats_interval = stats_interval
+        self.last_frame_time = None
+        self.last_stats_time = 0
+
         # Get the directory of the current script
         self.current_directory = os.path.dirname(os.path.abspath(__file__))
 
@@ -30,8 +128,11 @@ class SimpleGUI(threading.Thread):
         self.relative_path_to_font2 = os.path.join(self.current_directory, '../../resources/fonts/smallest_pixel-7.ttf')
         self.relative_path_to_font3 = os.path.join(self.current_directory, '../../resources/fonts/smallest_pixel-7.ttf')
 
-        # Frame buffer coordinates
-        self.fb = Framebuffer(0)
+        # Frame buffer coordinates, mapped once so dirty regions can be
+        # copied straight into display memory. A different framebuffer (e.g.
+        # an OffscreenFramebuffer) can be passed in to run without HDMI.
+        # With double_buffer frames are drawn off screen and page flipped in.
+        self.fb = fb or Framebuffer(0, use_mmap=True, double_buffer=double_buffer)
         self.cx = self.fb.size[0] // 2  
         self.cy = self.fb.size[1] // 2
 
@@ -63,17 +164,36 @@ class SimpleGUI(threading.Thread):
         self.latest_wav = None
         
         # Hide the cursor
-        self.hide_cursor() 
+        if fb is None:
+            self.hide_cursor() 
         
         # Check if /dev/fb0 exists
         fb_path = "/dev/fb0"
-        if os.path.exists(fb_path):
-            self.fb = Framebuffer(0)
+        if fb is not None or os.path.exists(fb_path):
             self.disp_width, self.disp_height = self.fb.size
         else:
             logging.info(f"No HDMI display found")    
 
-        self.start()
+        # Retained-mode compositor holding the last rendered frame, drawn
+        # directly in the framebuffer's pixel format
+        self.compositor = Compositor(self.fb.size, self.fb.to_native if self.fb.bits_per_pixel else None)
+        self.layouts = {}
+        self.base_layers = {}
+        self.base_layers_layout = None
+
+        if self.event_driven:
+            self.redis_controller.redis_parameter_changed.subscribe(self.handle_redis_event, keys=self.REDRAW_KEYS)
+            self.cinepi_controller.state_changed_event.subscribe(self.request_redraw)
+            self.usb_monitor.usb_event.subscribe(self.request_redraw)
+            self.ssd_monitor.ssd_event.subscribe(self.request_redraw)
+            self.ssd_monitor.unmount_event.subscribe(self.request_redraw)
+            self.serial_handler.ports_changed_event.subscribe(self.request_redraw)
+            self.dmesg_monitor.undervoltage_event.subscribe(self.request_redraw)
+            if self.redis_listener:
+                self.redis_listener.frame_drop_event.subscribe(self.request_redraw)
+
+        if autostart:
+            self.start()
         
         logging.info(f"Simple GUI instantiated. HDMI {self.fb.size}")
 
@@ -82,7 +202,7 @@ class SimpleGUI(threading.Thread):
         self.shutter_a = (str(self.redis_controller.get_value('shutter_a')).replace('.0', ''))
         self.shutter_a_nom = (str(self.redis_controller.get_value('shutter_a_nom')).replace('.0', ''))
         self.fps = int(self.cinepi_controller.fps_actual)
-        self.is_recording = int(self.redis_controller.get_value('is_writing_buf'))
+        self.is_recording = self.redis_controller.get_int('is_writing_buf')
         self.latest_frame = False
         
         self.min_left = None
@@ -96,189 +216,162 @@ class SimpleGUI(threading.Thread):
         self.cpu_load = str(psutil.cpu_percent()) + '%'
         self.cpu_temp = ('{}\u00B0'.format(int(CPUTemperature().temperature)))
 
+    def request_redraw(self, *args):
+        self.redraw_event.set()
+
+    def handle_redis_event(self, data):
+        self.redraw_event.set()
+
     def hide_cursor(self):
         try:
             subprocess.call(["sudo", "sh", "-c", "echo 0 > /sys/class/graphics/fbcon/cursor_blink"])  # Execute command to hide cursor
         except Exception as e:
             print(f"Error occurred while hiding cursor: {e}")
 
+    def get_layout(self, gui_layout):
+        """Widget slots of a layout with their fonts resolved"""
+        if gui_layout not in self.layouts:
+            self.layouts[gui_layout] = {
+                name: (xy, get_font(self.relative_path_to_font, size), label)
+                for name, (xy, size, label) in GUI_LAYOUTS.get(gui_layout, {}).items()}
+        return self.layouts[gui_layout]
+
+    def get_base_layer(self, gui_layout, fill_color):
+        """Static background of a layout, built on first use.
+
+        Layers of the previous layout are dropped on a layout switch
+        (CinePiController.set_resolution) and rebuilt lazily.
+        """
+        if gui_layout != self.base_layers_layout:
+            self.base_layers = {}
+            self.base_layers_layout = gui_layout
+        if fill_color not in self.base_layers:
+            self.base_layers[fill_color] = Image.new("RGB", self.fb.size, fill_color)
+        return self.base_layers[fill_color]
+
     def draw_display(self):
         try:
+            composite_start = time.perf_counter()
             if self.is_recording == 1:
                 self.fill_color = "red"
             else:
                 self.fill_color = "black"
-            image = Image.new("RGBA", self.fb.size)
-            draw = ImageDraw.Draw(image)
-            draw.rectangle(((0, 0), self.fb.size), fill=self.fill_color)
-            font = ImageFont.truetype(os.path.realpath(self.relative_path_to_font), 34)
-            font2 = ImageFont.truetype(os.path.realpath(self.relative_path_to_font), 51)
-            font3 = ImageFont.truetype(os.path.realpath(self.relative_path_to_font), 28)
-            font4 = ImageFont.truetype(os.path.realpath(self.relative_path_to_font), 26)
-            font5 = ImageFont.truetype(os.path.realpath(self.relative_path_to_font), 16)
+
+            gui_layout = self.cinepi_controller.gui_layout
+            slots = self.get_layout(gui_layout)
+            widgets = {}
+
+            def place(name, text=None, fill="white"):
+                if name in slots:
+                    xy, font, label = slots[name]
+                    widgets[name] = Widget(xy, label if text is None else text, font, fill)
 
             self.exposure_time = int((float(self.shutter_a)/360)*(1/float(self.fps))*1000000)
 
-            if self.cinepi_controller.gui_layout == 0:
-
-                # GUI Upper line
-                draw.text((10, -7), str(self.iso), font=font, fill="white")
-                if self.cinepi_controller.pwm_mode == False:
-                    draw.text((110, -7), str(self.shutter_a), font=font, fill="white")
-                    draw.text((205, -7), str(self.fps), font=font, fill="white")
-                elif self.cinepi_controller.pwm_mode == True:
-                    draw.text((110, -7), str(self.pwm_controller.shutter_angle), font=font, fill="lightgreen")
-                    draw.text((205, -7), str(int(round(float(self.pwm_controller.fps),0))), font=font, fill="lightgreen")
-                    
-                if self.cinepi_controller.fps_double == True:
-                    draw.text((205, -7), str(self.fps), font=font, fill="lightgreen")
-                    draw.text((1090, -2), 'FPS SW', font=font4, fill="lightgreen")
-                
-                draw.text((1210, -7), str(self.cinepi_controller.exposure_time_fractions), font=font, fill="white")
-                if self.cinepi_controller.pwm_mode == True:
-                    draw.text((1323, -2), 'PWM', font=font4, fill="lightgreen")
-                
-                if self.cinepi_controller.shutter_a_sync == True:
-                    draw.text((1425, -2), 'SYNC   /', font=font4, fill="white")
-                    draw.text((1525, -2), str(self.shutter_a_nom), font=font4, fill="white")
-                    
-                if self.cinepi_controller.parameters_lock == True:
-                    draw.text((1610, -2), 'LOCK', font=font4, fill=(255,0,0,255))
-
-                if self.dmesg_monitor.undervoltage_flag:
-                    if self.is_recording:
-                        draw.text((1700, -2), str('VOLT'), font=font4, fill="black")
-                    else:                        
-                        draw.text((1700, -2), str('VOLT'), font=font4, fill="yellow")
-                
-                draw.text((1790, -2), str(self.cpu_load), font=font4, fill="white")
-                draw.text((1875, -2), str(self.cpu_temp), font=font4, fill="white")
-            
-                # GUI Lower line
-                if self.min_left:
-                    draw.text((10, 1044), str(self.min_left) + " MIN", font=font, fill="white")
-                else:
-                    draw.text((10, 1044), 'NO DISK', font=font, fill="white")
-                    
-                if self.usb_monitor.usb_mic:
-                    draw.text((160, 1050), 'MIC', font=font4, fill="white")
-                    
-                if self.usb_monitor.usb_keyboard:
-                    draw.text((225, 1050), 'KEY', font=font4, fill="white")
-
-                if '/dev/ttyACM0' in self.serial_handler.current_ports:
-                    draw.text((290, 1050), 'SER', font=font4, fill="white")
-
-                if self.wav_recorded:
-                    draw.text((1445, 1050), ' |   WAV', font=font4, fill="white")
-                
-            if self.cinepi_controller.gui_layout == 1:
-                
-                # GUI Upper line
-                draw.text((0, -7), str(self.iso), font=font2, fill=("white"))
-                if self.cinepi_controller.pwm_mode == False:
-                    draw.text((10, 80), str(self.shutter_a), font=font2, fill="white")
-                    draw.text((10, 167), str(self.fps), font=font2, fill="white")
-                elif self.cinepi_controller.pwm_mode == True:
-                    draw.text((10, 80), str(self.pwm_controller.shutter_angle), font=font2, fill="lightgreen")
-                    draw.text((10, 167), str(int(round(float(self.pwm_controller.fps),0))), font=font2, fill="lightgreen")
-                    
-                if self.cinepi_controller.fps_double == True:
-                    draw.text((10, 260), 'FPS SW', font=font, fill="lightgreen")
-                    draw.text((10, 167), str(self.fps), font=font2, fill="lightgreen")
-                
-                draw.text((10, 340), str(self.cinepi_controller.exposure_time_fractions), font=font2, fill="white")
-
-                if self.cinepi_controller.pwm_mode == True:
-                    draw.text((10, 427), 'PWM', font=font, fill="lightgreen")
-
-                if self.cinepi_controller.shutter_a_sync == True:
-                    draw.text((10, 495), 'SYNC', font=font, fill="white")
-                    draw.text((10, 540), str(self.shutter_a_nom), font=font, fill="white")
-                    
-                if self.cinepi_controller.parameters_lock == True:
-                    draw.text((10, 610), 'LOCK', font=font, fill=(255,0,0,255))
-                
-                if self.dmesg_monitor.undervoltage_flag:
-                    if self.is_recording:
-                        draw.text((10, 680), str('VOLTAGE'), font=font, fill="black")
-                    else:
-                        draw.text((10, 680), str('VOLTAGE'), font=font, fill="yellow")   
-                    
-
-                draw.text((1740, -7), str(self.cpu_load), font=font, fill="white")
-                draw.text((1860, -7), str(self.cpu_temp), font=font, fill="white")
-                
-                # GUI Lower line
-                if self.min_left:
-                    draw.text((10, 1044), str(self.min_left) + " MIN", font=font, fill="white")
-                else:
-                    draw.text((10, 1044), 'NO DISK', font=font, fill="white")
-                    
-                if self.usb_monitor.usb_mic:
-                    draw.text((10, 910), 'MIC', font=font4, fill="white")
-                    
-                if self.usb_monitor.usb_keyboard:
-                    draw.text((10, 950), 'KEY', font=font4, fill="white")
-
-                if '/dev/ttyACM0' in self.serial_handler.current_ports:
-                    draw.text((10, 990), 'SER', font=font4, fill="white")
-
-            if self.cinepi_controller.gui_layout == 2:
-                
-                # GUI Upper line
-                draw.text((-3, -7), str(self.iso), font=font, fill=("white"))
-                if self.cinepi_controller.pwm_mode == False:
-                    draw.text((-3, 80), str(self.shutter_a), font=font, fill="white")
-                    draw.text((-3, 167), str(self.fps), font=font, fill="white")
-                elif self.cinepi_controller.pwm_mode == True:
-                    draw.text((-3, 80), str(self.pwm_controller.shutter_angle), font=font, fill="lightgreen")
-                    draw.text((-3, 167), str(int(round(float(self.pwm_controller.fps),0))), font=font, fill="lightgreen")
-                    
-                if self.cinepi_controller.fps_double == True:
-                    draw.text((-3, 260), 'FPS SW', font=font, fill="lightgreen")
-                    draw.text((-3, 167), str(self.fps), font=font, fill="lightgreen")
-                
-                draw.text((-3, 340), str(self.cinepi_controller.exposure_time_fractions), font=font, fill="white")
-
-                if self.cinepi_controller.pwm_mode == True:
-                    draw.text((-3, 427), 'PWM', font=font3, fill="lightgreen")
-
-                if self.cinepi_controller.shutter_a_sync == True:
-                    draw.text((-3, 495), 'SYNC', font=font3, fill="white")
-                    draw.text((-3, 540), str(self.shutter_a_nom), font=font, fill="white")
-                    
-                if self.cinepi_controller.parameters_lock == True:
-                    draw.text((-3, 610), 'LOCK', font=font3, fill=(255,0,0,255))
-                
-                if self.dmesg_monitor.undervoltage_flag:
-                    if self.is_recording:
-                        draw.text((-3, 680), str('VOLTAGE'), font=font, fill="black")
-                    else:
-                        draw.text((-3, 680), str('VOLTAGE'), font=font, fill="yellow")   
-
-                draw.text((1862, -7), str(self.cpu_load), font=font4, fill="white")
-                draw.text((1862, 21), str(self.cpu_temp), font=font4, fill="white")
-                
-                # GUI Lower line
-                if self.min_left:
-                    draw.text((-3, 1044), str(self.min_left) + " MIN", font=font4, fill="white")
+            # GUI Upper line
+            place('iso', self.iso)
+            if self.cinepi_controller.pwm_mode == False:
+                place('shutter_a', self.shutter_a)
+                place('fps', self.fps)
+            elif self.cinepi_controller.pwm_mode == True:
+                place('shutter_a', self.pwm_controller.shutter_angle, "lightgreen")
+                place('fps', int(round(float(self.pwm_controller.fps),0)), "lightgreen")
+
+            if self.cinepi_controller.fps_double == True:
+                place('fps', self.fps, "lightgreen")
+                place('fps_sw', fill="lightgreen")
+
+            place('exposure', self.cinepi_controller.exposure_time_fractions)
+            if self.cinepi_controller.pwm_mode == True:
+                place('pwm', fill="lightgreen")
+
+            if self.cinepi_controller.shutter_a_sync == True:
+                place('sync')
+                place('shutter_a_nom', self.shutter_a_nom)
+
+            if self.cinepi_controller.parameters_lock == True:
+                place('lock', fill=(255,0,0,255))
+
+            if self.dmesg_monitor.undervoltage_flag:
+                if self.is_recording:
+                    place('volt', fill="black")
                 else:
-                    draw.text((-3, 1044), 'NO DISK', font=font4, fill="white")
-                    
-                if self.usb_monitor.usb_mic:
-                    draw.text((-3, 910), 'MIC', font=font4, fill="white")
-                    
-                if self.usb_monitor.usb_keyboard:
-                    draw.text((-3, 950), 'KEY', font=font4, fill="white")
-
-                if '/dev/ttyACM0' in self.serial_handler.current_ports:
-                    draw.text((-3, 990), 'SER', font=font4, fill="white")
-
-            self.fb.show(image)
+                    place('volt', fill="yellow")
+
+            place('cpu_load', self.cpu_load)
+            place('cpu_temp', self.cpu_temp)
+
+            # GUI Lower line
+            if self.min_left:
+                place('min_left', str(self.min_left) + " MIN")
+            else:
+                place('min_left', 'NO DISK')
+
+            if self.usb_monitor.usb_mic:
+                place('mic')
+
+            if self.usb_monitor.usb_keyboard:
+                place('key')
+
+            if '/dev/ttyACM0' in self.serial_handler.current_ports:
+                place('ser')
+
+            if self.wav_recorded:
+                place('wav')
+
+            if self.redis_listener and self.redis_listener.frames_dropped:
+                place('drop', f"DROP {self.redis_listener.frames_dropped}", "yellow")
+
+            if self.perf_overlay:
+                widgets['perf'] = Widget((self.fb.size[0] - 720, self.fb.size[1] - 70),
+                                         self.perf_text(), get_font(self.relative_path_to_font, 16), "lightgreen")
+
+            # Only re-rasterize the widgets that changed since the last frame
+            base_layer = self.get_base_layer(gui_layout, self.fill_color)
+            dirty = self.compositor.update(widgets, base_layer)
+            self.perf.add('composite', (time.perf_counter() - composite_start) * 1000)
+
+            with self.perf.measure('blit'):
+                self.fb.present(self.compositor.canvas, dirty)
         except OSError as e:
+            # Repaint everything once the framebuffer is writable again
+            self.compositor.invalidate()
             print(f"Error occurred in draw_display: {e}")
             
+    def perf_text(self):
+        """One line summary of GUI fps and p50/p95 stage timings in ms"""
+        stats = self.perf.summary()
+        interval = stats.get('interval', {}).get('p50')
+        text = f"GUI {1000 / interval:.1f} fps" if interval else "GUI -- fps"
+        for stage in ('get_values', 'composite', 'blit'):
+            if stage in stats:
+                text += f"  {stage} {stats[stage]['p50']}/{stats[stage]['p95']}"
+        return text + " ms"
+
+    def publish_stats(self):
+        stats = self.perf.summary()
+        stats['fb'] = {'size': self.fb.size, 'bits_per_pixel': self.fb.bits_per_pixel,
+                       'double_buffered': self.fb.double_buffered}
+        self.redis_controller.set_stat('gui_stats', json.dumps(stats))
+
+    def render_frame(self):
+        frame_start = time.perf_counter()
+        if self.last_frame_time is not None:
+            self.perf.add('interval', (frame_start - self.last_frame_time) * 1000)
+        self.last_frame_time = frame_start
+
+        with self.perf.measure('get_values'):
+            self.get_values()
+        self.draw_display()
+        self.perf.add('frame', (time.perf_counter() - frame_start) * 1000)
+
+        if frame_start - self.last_stats_time >= self.stats_interval:
+            self.last_stats_time = frame_start
+            try:
+                self.publish_stats()
+            except Exception as e:
+                logging.warning(f"Could not publish GUI stats: {e}")
+
     def wrap_text(self, text, font, max_width):
         """
         Wrap the text based on the given font and max_width.
@@ -296,9 +389,16 @@ class SimpleGUI(threading.Thread):
     def run(self):
         try:
             while True:
-                self.get_values()
-                self.draw_display()
-                time.sleep(0.1)
+                if self.event_driven:
+                    # Sleep until something changed or the heartbeat is due,
+                    # then give bursts of changes a moment to settle
+                    if self.redraw_event.wait(self.heartbeat_interval):
+                        time.sleep(self.coalesce_interval)
+                    self.redraw_event.clear()
+                    self.render_frame()
+                else:
+                    self.render_frame()
+                    time.sleep(0.1)
         except Exception as e:
             error_msg = f"Error occurred in 'run' loop of SimpleGUI: {e}\n"
             error_msg += "Exception type: " + str(type(e)) + "\n"
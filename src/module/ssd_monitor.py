@@ -112,6 +112,8 @@ class SSDMonitor():
         return self.disk_mounted
 
     def on_ssd_added(self):
+        self.ssd_event.emit(f"SSD mounted at {self.disk_mounted}")
+
         # Start a thread to perform continuous actions on SSD connection
         self._ssd_thread_stop_event.clear()  # Ensure the stop event is clear
         self._ssd_thread = threading.Thread(target=self._ssd_actions)
@@ -286,6 +288,18 @@ class DirectoryWatcher:
 
         self.add_watch_for_directory(latest_directory)
                 
+    def start_take(self):
+        """Forget the previous take's frames, called when recording starts"""
+        with self.lock:
+            self.last_dng_file_added = None
+
+    def current_take_folder(self):
+        """Folder of the DNGs written since start_take, None if none were"""
+        with self.lock:
+            if self.last_dng_file_added:
+                return os.path.dirname(self.last_dng_file_added)
+        return None
+
     def handle_event(self):
         for event in self.inotify.read():
             with self.lock:
@@ -0,0 +1,97 @@
+"""Round-trip latency of Redis over TCP and over the Unix domain socket.
+
+Run on the camera with redis-server up:
+
+    python3 redis_benchmark.py [--count 2000] [--socket /var/run/redis/redis-server.sock]
+
+The socket needs `unixsocket` (and `unixsocketperm 770` or similar) in
+/etc/redis/redis.conf. Connection settings default to the "redis" section
+of settings.json. Each operation is timed individually and reported as
+mean/p50/p95/max in microseconds. Only the key redis_benchmark and the
+channel cp_benchmark are used, so cinepi-raw is not disturbed.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import redis
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from module.perf_stats import RollingStats
+from module.redis_controller import get_connection_pool
+
+KEY = 'redis_benchmark'
+CHANNEL = 'cp_benchmark'
+
+
+def time_operation(operation, count):
+    stats = RollingStats(window=count)
+    total = 0
+    for _ in range(count):
+        start = time.perf_counter()
+        operation()
+        elapsed = (time.perf_counter() - start) * 1000000
+        stats.add(elapsed)
+        total += elapsed
+    summary = stats.summary()
+    summary['mean'] = total / count
+    return summary
+
+
+def benchmark(name, client, count):
+    client.set(KEY, 0)
+
+    def set_and_publish():
+        client.set(KEY, 1)
+        client.publish(CHANNEL, KEY)
+
+    def pipelined_set_and_publish():
+        pipe = client.pipeline(transaction=False)
+        pipe.set(KEY, 1)
+        pipe.publish(CHANNEL, KEY)
+        pipe.execute()
+
+    operations = {
+        'PING': client.ping,
+        'GET': lambda: client.get(KEY),
+        'SET+PUBLISH': set_and_publish,
+        'pipelined SET+PUBLISH': pipelined_set_and_publish,
+    }
+    for label, operation in operations.items():
+        operation()  # connect and warm up
+        s = time_operation(operation, count)
+        print(f"{name:<6} {label:<22} {s['mean']:>8.1f} {s['p50']:>8.1f} {s['p95']:>8.1f} {s['max']:>9.1f}")
+    client.delete(KEY)
+
+
+def main():
+    settings_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'settings.json')
+    try:
+        with open(settings_path, 'r') as file:
+            settings = json.load(file).get('redis', {})
+    except (OSError, ValueError):
+        settings = {}
+
+    parser = argparse.ArgumentParser(description="Redis TCP vs Unix socket latency")
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--host', default=settings.get('host', 'localhost'))
+    parser.add_argument('--port', type=int, default=settings.get('port', 6379))
+    parser.add_argument('--socket', default=settings.get('unix_socket_path', '/var/run/redis/redis-server.sock'))
+    args = parser.parse_args()
+
+    print(f"{'':<6} {'operation':<22} {'mean us':>8} {'p50 us':>8} {'p95 us':>8} {'max us':>9}")
+    benchmark('tcp', redis.StrictRedis(connection_pool=get_connection_pool(args.host, args.port)), args.count)
+    if os.path.exists(args.socket):
+        pool = get_connection_pool(args.host, args.port, unix_socket_path=args.socket)
+        benchmark('unix', redis.StrictRedis(connection_pool=pool), args.count)
+    else:
+        print(f"{args.socket} not found, enable unixsocket in redis.conf to compare")
+
+
+if __name__ == "__main__":
+    main()